@@ -1,16 +1,247 @@
-from flask import Flask, render_template, request, redirect, session, flash, jsonify, send_file, url_for
+from flask import Flask, render_template, request, redirect, session, flash, jsonify, url_for, Response, stream_with_context, g, has_request_context, before_render_template, template_rendered
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, DDL, create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from werkzeug.security import generate_password_hash, check_password_hash
-import os, qrcode, io, datetime, secrets, smtplib, pytz
+from werkzeug.utils import secure_filename
+import os, io, sys, csv, hmac, json, time, sqlite3, hashlib, atexit, calendar, functools, itertools, datetime, secrets, threading, multiprocessing, pytz
+from concurrent.futures import as_completed
 from email.message import EmailMessage
+from ttl_cache import TTLCache
+from ingest import BatchWriter
+from qr_cache import QRCache, render_png
+from bulk_import import read_rows, ImportJob
+import retention
+from mailer import SMTPPool, backoff
+from broadcast import BroadcastHub
+from metrics import Counter, Gauge, Histogram, render_all, timed, operation_seconds
+from pdf import A4, Page, PDFStream
+from search import REGISTRATION_DDL, PRESENCE_DDL, registration_match, plate_match, compact, is_fts_object
+from signing import CodeSigner, parse_keys
+from webhook import post_json
+import snapshot
+
+DEFAULT_SECRET_KEY = 'default-secret-key'
 
 app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'default-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///vehicle_log.db'
+app.secret_key = os.getenv('SECRET_KEY', DEFAULT_SECRET_KEY)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///vehicle_log.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+app.config['LOGS_PAGE_SIZE'] = int(os.getenv('LOGS_PAGE_SIZE', '50'))
+app.config['EXPORT_CHUNK_SIZE'] = int(os.getenv('EXPORT_CHUNK_SIZE', '1000'))
+app.config['SCAN_CACHE_SIZE'] = int(os.getenv('SCAN_CACHE_SIZE', '4096'))
+app.config['SCAN_CACHE_TTL'] = int(os.getenv('SCAN_CACHE_TTL', '300'))
+# 'sync' commits every scan before answering; 'batched' queues scans for a
+# background writer that group-commits them (faster, but a crash can lose
+# up to one batch)
+app.config['INGEST_MODE'] = os.getenv('INGEST_MODE', 'sync')
+app.config['INGEST_BATCH_SIZE'] = int(os.getenv('INGEST_BATCH_SIZE', '200'))
+app.config['INGEST_MAX_DELAY_MS'] = int(os.getenv('INGEST_MAX_DELAY_MS', '50'))
+app.config['INGEST_QUEUE_SIZE'] = int(os.getenv('INGEST_QUEUE_SIZE', '10000'))
+app.config['TRACK_BATCH_MAX'] = int(os.getenv('TRACK_BATCH_MAX', '500'))
+# Repeat scans of a plate within this many seconds are answered without
+# being recorded (0 = off)
+app.config['SCAN_DEBOUNCE_SECONDS'] = int(os.getenv('SCAN_DEBOUNCE_SECONDS', '10'))
+app.config['IDEMPOTENCY_CACHE_SIZE'] = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+app.config['IDEMPOTENCY_CACHE_TTL'] = int(os.getenv('IDEMPOTENCY_CACHE_TTL', '3600'))
+app.config['QR_CACHE_DIR'] = os.getenv('QR_CACHE_DIR', 'qr_cache')
+app.config['QR_CACHE_SIZE'] = int(os.getenv('QR_CACHE_SIZE', '512'))
+app.config['QR_MAX_AGE'] = int(os.getenv('QR_MAX_AGE', '86400'))
+# QR codes carry a signed payload, "id:secret" pairs comma separated. The
+# first key signs new codes, the rest are still accepted until removed.
+# Empty derives a single key from SECRET_KEY, which must then be set.
+app.config['QR_SIGNING_KEYS'] = os.getenv('QR_SIGNING_KEYS', '')
+app.config['QR_REVOCATION_TTL'] = int(os.getenv('QR_REVOCATION_TTL', '60'))
+app.config['QR_RENDER_WORKERS'] = int(os.getenv('QR_RENDER_WORKERS', '0')) or None  # None = one per CPU
+app.config['IMPORT_MAX_ROWS'] = int(os.getenv('IMPORT_MAX_ROWS', '5000'))
+app.config['RETENTION_DAYS'] = int(os.getenv('RETENTION_DAYS', '365'))
+app.config['ARCHIVE_DIR'] = os.getenv('ARCHIVE_DIR', 'archive')
+app.config['PURGE_CHUNK_SIZE'] = int(os.getenv('PURGE_CHUNK_SIZE', '1000'))
+app.config['SMTP_HOST'] = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+app.config['SMTP_PORT'] = int(os.getenv('SMTP_PORT', '587'))
+app.config['SMTP_STARTTLS'] = os.getenv('SMTP_STARTTLS', '1') == '1'
+app.config['MAIL_FROM'] = os.getenv('MAIL_FROM', 'noreply@judiciary.go.ke')
+app.config['MAIL_MAX_ATTEMPTS'] = int(os.getenv('MAIL_MAX_ATTEMPTS', '6'))
+app.config['MAIL_RETRY_BASE'] = int(os.getenv('MAIL_RETRY_BASE', '30'))
+app.config['MAIL_POLL_INTERVAL'] = int(os.getenv('MAIL_POLL_INTERVAL', '30'))
+# Seconds after a confirmed admin password during which destructive actions
+# don't ask (and hash) again; 0 disables the window
+app.config['ELEVATION_WINDOW'] = int(os.getenv('ELEVATION_WINDOW', '300'))
+app.config['BULK_DELETE_MAX'] = int(os.getenv('BULK_DELETE_MAX', '1000'))
+# Every open live log feed holds a server thread (waitress defaults to 4),
+# so keep SSE_MAX_CLIENTS below the thread count. Streams end after
+# SSE_MAX_DURATION seconds and the browser reconnects, resuming from the
+# last row it saw.
+app.config['SSE_MAX_CLIENTS'] = int(os.getenv('SSE_MAX_CLIENTS', '2'))
+app.config['SSE_BUFFER_SIZE'] = int(os.getenv('SSE_BUFFER_SIZE', '100'))
+app.config['SSE_KEEPALIVE'] = float(os.getenv('SSE_KEEPALIVE', '15'))
+app.config['SSE_MAX_DURATION'] = float(os.getenv('SSE_MAX_DURATION', '300'))
+app.config['SSE_BACKFILL_MAX'] = int(os.getenv('SSE_BACKFILL_MAX', '500'))
+# Log requests slower than this many milliseconds (0 = off). /metrics needs
+# an admin session, or METRICS_TOKEN as a bearer token for scrapers.
+app.config['SLOW_REQUEST_MS'] = int(os.getenv('SLOW_REQUEST_MS', '0'))
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+app.config['SEARCH_LIMIT'] = int(os.getenv('SEARCH_LIMIT', '20'))
+# 'snapshot' serves the admin log, vehicle, occupancy and export views from
+# a copy of the database refreshed every REPORTING_REFRESH_SECONDS, so long
+# reports don't hold locks the gates need. A copy older than
+# REPORTING_MAX_AGE (e.g. the refresher died) is ignored.
+app.config['REPORTING_MODE'] = os.getenv('REPORTING_MODE', 'live')
+app.config['REPORTING_DB'] = os.getenv('REPORTING_DB', os.path.join(app.instance_path, 'reporting_snapshot.db'))
+app.config['REPORTING_REFRESH_SECONDS'] = int(os.getenv('REPORTING_REFRESH_SECONDS', '60'))
+app.config['REPORTING_MAX_AGE'] = int(os.getenv('REPORTING_MAX_AGE', '600'))
+# Alert rules, evaluated every ALERT_INTERVAL seconds in the background: a
+# vehicle still inside OVERSTAY_HOURS after its entry, and
+# REJECTION_ALERT_COUNT refused scans of one plate within
+# REJECTION_ALERT_WINDOW seconds (0 turns a rule off). Alerts land in the
+# /alerts inbox and are POSTed to ALERT_WEBHOOK_URL when it is set.
+app.config['ALERT_INTERVAL'] = int(os.getenv('ALERT_INTERVAL', '60'))
+app.config['OVERSTAY_HOURS'] = float(os.getenv('OVERSTAY_HOURS', '12'))
+app.config['REJECTION_ALERT_COUNT'] = int(os.getenv('REJECTION_ALERT_COUNT', '3'))
+app.config['REJECTION_ALERT_WINDOW'] = int(os.getenv('REJECTION_ALERT_WINDOW', '600'))
+app.config['REJECTED_SCAN_RETENTION_DAYS'] = int(os.getenv('REJECTED_SCAN_RETENTION_DAYS', '30'))
+app.config['ALERT_WEBHOOK_URL'] = os.getenv('ALERT_WEBHOOK_URL', '')
+app.config['ALERT_WEBHOOK_SECRET'] = os.getenv('ALERT_WEBHOOK_SECRET', '')
+app.config['ALERT_WEBHOOK_MAX_ATTEMPTS'] = int(os.getenv('ALERT_WEBHOOK_MAX_ATTEMPTS', '8'))
+app.config['ALERT_WEBHOOK_RETRY_BASE'] = int(os.getenv('ALERT_WEBHOOK_RETRY_BASE', '30'))
+
+class RoutedSession(Session):
+    # Views marked @reads_snapshot set g.snapshot_engine for their request
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context() and g.get('snapshot_engine') is not None:
+            return g.snapshot_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutedSession})
+
+def include_in_migrations(object, name, type_, reflected, compare_to):
+    return not is_fts_object(name, type_)
+
+# Newest migration; create_app() upgrades any database behind it.
+# test_startup checks it against the head of migrations/.
+SCHEMA_REVISION = '9070e298a338'
+# The first migration is the schema db.create_all() made before migrations
+BASELINE_REVISION = '72ff1f82e9c5'
+# Bundled next to the code, also inside the PyInstaller EXE
+MIGRATIONS_DIR = os.path.join(getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+def init_migrations():
+    # Alembic is one of the slowest imports, so plain `import app` skips it;
+    # `flask db ...` and create_app() on an outdated database load it
+    from flask_migrate import Migrate
+    return Migrate(app, db, directory=MIGRATIONS_DIR, render_as_batch=True, include_object=include_in_migrations)
+
+def schema_revision():
+    # None for a database that has never been migrated
+    if not db.inspect(db.engine).has_table('alembic_version'):
+        return None
+    return db.session.execute(db.text('SELECT version_num FROM alembic_version')).scalar()
+
+def unversioned_revision():
+    # Tables made by db.create_all() carry no version: either the baseline
+    # schema or, from older create_app() runs, the full current schema
+    inspector = db.inspect(db.engine)
+    if not inspector.has_table('movement'):
+        return None
+    if 'gate' not in {c['name'] for c in inspector.get_columns('movement')}:
+        return BASELINE_REVISION
+    if all(inspector.has_table(t.name) and set(t.columns.keys()) <= {c['name'] for c in inspector.get_columns(t.name)}
+           for t in db.metadata.sorted_tables):
+        return SCHEMA_REVISION
+    raise RuntimeError('Database has no schema version and does not match a known schema; '
+                       'run `flask db stamp <revision>` for the revision it matches, then `flask db upgrade`.')
+
+def upgrade_database():
+    # Usually one query; alembic is only loaded when there is work to do
+    revision = schema_revision()
+    if revision == SCHEMA_REVISION:
+        return
+    from flask_migrate import stamp, upgrade
+    if 'migrate' not in app.extensions:
+        init_migrations()
+    if revision is None:
+        revision = unversioned_revision()
+        if revision:
+            stamp(MIGRATIONS_DIR, revision)
+    if revision != SCHEMA_REVISION:
+        upgrade(MIGRATIONS_DIR)
+        app.logger.info('Database upgraded from %s to %s', revision or 'empty', SCHEMA_REVISION)
+
+# The flask command sets this before it loads the app
+if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+    init_migrations()
+
+request_seconds = Histogram('http_request_duration_seconds', 'Request latency by route.', ['route', 'method'])
+requests_total = Counter('http_requests_total', 'Requests by route and status.', ['route', 'method', 'status'])
+request_sql_statements = Histogram('http_request_sql_statements', 'SQL statements executed per request.', ['route'],
+                                   buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250))
+request_db_seconds = Histogram('http_request_db_seconds', 'Time spent in SQL per request.', ['route'])
+sql_statements_total = Counter('sql_statements_total', 'SQL statements executed.', ['context'])
+sql_seconds_total = Counter('sql_seconds_total', 'Time spent executing SQL.', ['context'])
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['sql_start'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('sql_start', time.perf_counter())
+    # Statements outside a request come from the batch writer, mail worker
+    # and maintenance jobs
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_time += elapsed
+        context = 'request'
+    else:
+        context = 'background'
+    sql_statements_total.inc(context=context)
+    sql_seconds_total.inc(elapsed, context=context)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+
+@app.after_request
+def mark_snapshot_reads(response):
+    as_of = data_as_of()
+    if as_of is not None:
+        response.headers['X-Data-As-Of'] = as_of[0].replace(microsecond=0).isoformat() + 'Z'
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_seconds.observe(elapsed, route=route, method=request.method)
+    requests_total.inc(route=route, method=request.method, status=response.status_code)
+    request_sql_statements.observe(g.sql_count, route=route)
+    request_db_seconds.observe(g.sql_time, route=route)
+    slow_ms = app.config['SLOW_REQUEST_MS']
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        app.logger.warning('Slow request: %s %s -> %s in %.0f ms (%d SQL statements, %.0f ms in SQL)',
+                           request.method, request.path, response.status_code,
+                           elapsed * 1000, g.sql_count, g.sql_time * 1000)
+    return response
+
+def start_template_timer(sender, template, context, **extra):
+    g.template_start = time.perf_counter()
+
+def stop_template_timer(sender, template, context, **extra):
+    start = g.pop('template_start', None)
+    if start is not None:
+        operation_seconds.observe(time.perf_counter() - start, operation=f"template:{template.name}")
+
+before_render_template.connect(start_template_timer, app)
+template_rendered.connect(stop_template_timer, app)
 
 nairobi_tz = pytz.timezone('Africa/Nairobi')
 
@@ -24,28 +255,549 @@ class Admin(db.Model):
         self.password_hash = generate_password_hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        with timed('password_hash_check'):
+            return check_password_hash(self.password_hash, password)
 
 class Registration(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     pj_number = db.Column(db.String(20), unique=True, nullable=False)
-    plate = db.Column(db.String(20), nullable=False)
+    plate = db.Column(db.String(20), nullable=False, index=True)
     owner = db.Column(db.String(100), nullable=False)
     institution = db.Column(db.String(100), nullable=False)
     qr_path = db.Column(db.String(100), nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
 
 class Movement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     plate = db.Column(db.String(20), nullable=False)
     action = db.Column(db.String(10), nullable=False)  # 'entry' or 'exit'
-    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    # Set by gate devices so replayed uploads are not recorded twice
+    idempotency_key = db.Column(db.String(64), nullable=True)
+    gate = db.Column(db.String(50), nullable=True)
+    __table_args__ = (
+        db.Index('ix_movement_plate_timestamp', 'plate', 'timestamp'),
+        db.Index('ix_movement_idempotency_key', 'idempotency_key', unique=True),
+        # Never reuse ids: watermarks and archive restores depend on it
+        {'sqlite_autoincrement': True},
+    )
 
 class AuthorizedDevice(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     mac_address = db.Column(db.String(17), unique=True, nullable=False)
     token = db.Column(db.String(64), unique=True, nullable=False)
 
+class QRRevocation(db.Model):
+    # QR codes of a registration issued at or before revoked_at are refused;
+    # one row per registration however many stickers were printed
+    registration_id = db.Column(db.Integer, primary_key=True)
+    revoked_at = db.Column(db.DateTime, nullable=False)
+
+class Presence(db.Model):
+    # Latest movement per plate, kept current by record_movements(); plates
+    # whose last action is 'entry' are on the premises
+    plate = db.Column(db.String(20), primary_key=True)
+    last_action = db.Column(db.String(10), nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    gate = db.Column(db.String(50), nullable=True)
+    __table_args__ = (
+        # Vehicles on site, and the overstay rule's "entered before" range
+        db.Index('ix_presence_action_timestamp', 'last_action', 'last_timestamp'),
+    )
+
+class Visit(db.Model):
+    # One stay on the premises, paired from Movement as scans are recorded:
+    # 'closed' (an entry and the exit after it), 'open' (still inside),
+    # 'missing_exit' (the plate entered again with no exit scanned) or
+    # 'orphan_exit' (an exit with no entry before it)
+    id = db.Column(db.Integer, primary_key=True)
+    plate = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(15), nullable=False)
+    entry_id = db.Column(db.Integer, nullable=True)
+    exit_id = db.Column(db.Integer, nullable=True)
+    entered_at = db.Column(db.DateTime, nullable=True)
+    exited_at = db.Column(db.DateTime, nullable=True)
+    duration_seconds = db.Column(db.Integer, nullable=True)  # closed visits only
+    # Left empty on the scan path and filled in by fill_visit_institutions()
+    institution = db.Column(db.String(100), nullable=True)
+    day = db.Column(db.Date, nullable=False)  # Nairobi date the visit started
+    __table_args__ = (
+        db.Index('ix_visit_plate_status', 'plate', 'status'),
+        db.Index('ix_visit_day', 'day'),
+        db.Index('ix_visit_institution_day', 'institution', 'day'),
+        db.Index('ix_visit_entry_id', 'entry_id'),
+        db.Index('ix_visit_exit_id', 'exit_id'),
+    )
+
+class RejectedScan(db.Model):
+    # Gate scans refused for a plate ('not_registered' or 'invalid_code'),
+    # read incrementally by the alert rules
+    id = db.Column(db.Integer, primary_key=True)
+    plate = db.Column(db.String(20), nullable=False)
+    reason = db.Column(db.String(20), nullable=False)
+    gate = db.Column(db.String(50), nullable=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, index=True)
+    __table_args__ = (
+        db.Index('ix_rejected_scan_plate_timestamp', 'plate', 'timestamp'),
+        {'sqlite_autoincrement': True},
+    )
+
+class Alert(db.Model):
+    # Raised by the alert rules; dedup_key makes evaluating an event twice harmless
+    id = db.Column(db.Integer, primary_key=True)
+    rule = db.Column(db.String(30), nullable=False)  # 'overstay' or 'repeated_rejection'
+    plate = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.String(255), nullable=False)
+    dedup_key = db.Column(db.String(100), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    acknowledged_at = db.Column(db.DateTime, nullable=True)
+    acknowledged_by = db.Column(db.String(80), nullable=True)
+    webhook_status = db.Column(db.String(10), nullable=True)  # None, 'pending', 'sent' or 'failed'
+    webhook_attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.String(255), nullable=True)
+    __table_args__ = (
+        db.Index('ix_alert_acknowledged_created', 'acknowledged_at', 'created_at'),
+        db.Index('ix_alert_webhook_status_next_attempt', 'webhook_status', 'next_attempt_at'),
+    )
+
+class TrafficRollup(db.Model):
+    # Movement counts per Nairobi-local hour, institution and action
+    bucket = db.Column(db.DateTime, primary_key=True)
+    institution = db.Column(db.String(100), primary_key=True)
+    action = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class Watermark(db.Model):
+    # Highest Movement.id (and for time-based jobs the time) already
+    # consumed by an incremental job
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    last_timestamp = db.Column(db.DateTime, nullable=True)
+
+class Outbox(db.Model):
+    # Outgoing email, persisted so queued mail survives restarts
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'sent' or 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    last_error = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (
+        db.Index('ix_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+# Scan-path lookups; both caches hold negative results too, so every write
+# that can change an answer must invalidate explicitly.
+device_cache = TTLCache(app.config['SCAN_CACHE_SIZE'], app.config['SCAN_CACHE_TTL'])
+plate_cache = TTLCache(app.config['SCAN_CACHE_SIZE'], app.config['SCAN_CACHE_TTL'])
+
+# Search indexes (see search.py) are created and dropped with their tables,
+# so create_all() in tests and scripts gets them too
+for statement in REGISTRATION_DDL:
+    event.listen(Registration.__table__, 'after_create', DDL(statement))
+event.listen(Registration.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS registration_fts'))
+for statement in PRESENCE_DDL:
+    event.listen(Presence.__table__, 'after_create', DDL(statement))
+event.listen(Presence.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS presence_fts'))
+
+def is_authorized_token(token):
+    return device_cache.get_or_load(
+        token, lambda: AuthorizedDevice.query.filter_by(token=token).first() is not None)
+
+def is_registered_plate(plate):
+    plate = plate.upper()
+    return plate_cache.get_or_load(
+        plate, lambda: Registration.query.filter_by(plate=plate).first() is not None)
+
+def make_code_signer():
+    # None without a key: one derived from the public default SECRET_KEY
+    # would let anyone sign codes
+    keys = parse_keys(app.config['QR_SIGNING_KEYS'])
+    if not keys and app.secret_key != DEFAULT_SECRET_KEY:
+        keys = {'k0': hmac.new(app.secret_key.encode(), b'qr-signing', hashlib.sha256).digest()}
+    return CodeSigner(keys) if keys else None
+
+# Signed QR codes (see signing.py) are checked in memory; the revocation list
+# and the registration a code names are read from the database once per
+# QR_REVOCATION_TTL and SCAN_CACHE_TTL per process. code_signer is None, and
+# create_app() refuses to start, until a signing key is configured.
+code_signer = make_code_signer()
+NO_SIGNING_KEY = 'Set QR_SIGNING_KEYS or SECRET_KEY to sign QR codes'
+revocations = TTLCache(1, app.config['QR_REVOCATION_TTL'])
+registration_plates = TTLCache(app.config['SCAN_CACHE_SIZE'], app.config['SCAN_CACHE_TTL'])
+code_checks = Counter('qr_code_checks_total', 'Signed QR codes checked at scan time, by result.', ['result'])
+
+snapshot_engines = {}
+snapshot_reads = Counter('reporting_reads_total', 'Admin read views by the database they were served from.', ['source'])
+
+def snapshot_engine():
+    # Read-only engine on the reporting copy; None when there is no usable copy
+    path = app.config['REPORTING_DB']
+    age = snapshot.age_seconds(path)
+    if age is None or age > app.config['REPORTING_MAX_AGE']:
+        return None
+    engine = snapshot_engines.get(path)
+    if engine is None:
+        uri = snapshot.read_only_uri(path)
+        engine = snapshot_engines.setdefault(path, create_engine(
+            'sqlite://', creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False), poolclass=QueuePool))
+    return engine
+
+def reads_snapshot(view):
+    # Read-only admin views; a request that follows a change (it has a flash
+    # message to show) reads live so the change is visible straight away
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        engine = None
+        if app.config['REPORTING_MODE'] == 'snapshot' and '_flashes' not in session:
+            engine = snapshot_engine()
+        g.snapshot_engine = engine
+        snapshot_reads.inc(source='snapshot' if engine is not None else 'live')
+        return view(*args, **kwargs)
+    return wrapper
+
+def data_as_of():
+    # (time of the reporting copy, age) for the current request, or None when live
+    if g.get('snapshot_engine') is None:
+        return None
+    path = app.config['REPORTING_DB']
+    return snapshot.taken_at(path), snapshot.age_seconds(path) or 0
+
+@app.context_processor
+def inject_data_as_of():
+    as_of = data_as_of() if has_request_context() else None
+    if as_of is None:
+        return {'data_as_of': None}
+    return {'data_as_of': to_nairobi(as_of[0]), 'data_age': snapshot.describe_age(as_of[1])}
+
+def epoch(dt):
+    return calendar.timegm(dt.utctimetuple())
+
+def live_rows(stmt):
+    # The scan-path caches are shared by every request, so they are always
+    # filled from the database itself, even inside a @reads_snapshot view
+    return db.session.execute(stmt, bind_arguments={'bind': db.engine})
+
+def revoked_codes():
+    # registration id -> codes issued at or before this time are revoked
+    return revocations.get_or_load('all', lambda: {
+        r.registration_id: epoch(r.revoked_at) for r in live_rows(db.select(QRRevocation)).scalars()})
+
+def revoke_codes(registration_ids):
+    # Caller commits, then clears `revocations`
+    if registration_ids:
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        # A code minted after the last revocation is issued a second after
+        # it, so a second revocation within that second must still cover it
+        previous = dict(db.session.query(QRRevocation.registration_id, QRRevocation.revoked_at)
+                        .filter(QRRevocation.registration_id.in_(registration_ids)))
+        second = datetime.timedelta(seconds=1)
+        stmt = sqlite_insert(QRRevocation).values([
+            {'registration_id': i, 'revoked_at': max(now, previous[i] + second) if i in previous else now}
+            for i in registration_ids])
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['registration_id'],
+                                                      set_={'revoked_at': stmt.excluded.revoked_at}))
+
+def code_issued(vehicle):
+    # Deterministic, so the same sticker is produced (and cached) until the
+    # registration's codes are revoked; a code minted after a revocation is
+    # issued just after it
+    issued = epoch(vehicle.timestamp) if vehicle.timestamp else 0
+    return max(issued, revoked_codes().get(vehicle.id, -1) + 1)
+
+def scan_code(vehicle):
+    if code_signer is None:
+        raise RuntimeError(NO_SIGNING_KEY)
+    return code_signer.sign(vehicle.plate, vehicle.id, code_issued(vehicle))
+
+def registration_plate(registration_id):
+    # Plate of a registration, or None once it is deleted
+    return registration_plates.get_or_load(registration_id, lambda: live_rows(
+        db.select(Registration.plate).where(Registration.id == registration_id)).scalar())
+
+def check_scan_code(code, plate=None):
+    # Returns (plate, error); error is None for a valid, unrevoked code
+    if code_signer is None:
+        code_checks.inc(result='invalid')
+        return None, 'Signed codes are not enabled'
+    try:
+        scan = code_signer.verify(code)
+    except ValueError as e:
+        code_checks.inc(result='invalid')
+        return None, str(e)
+    if plate is not None and scan.plate != plate.upper():
+        code_checks.inc(result='invalid')
+        return scan.plate, 'Code does not match plate'
+    if scan.issued <= revoked_codes().get(scan.registration_id, -1):
+        code_checks.inc(result='revoked')
+        return scan.plate, 'Code has been revoked'
+    if registration_plate(scan.registration_id) != scan.plate:
+        code_checks.inc(result='revoked')
+        return scan.plate, 'Vehicle is no longer registered'
+    code_checks.inc(result='valid')
+    return scan.plate, None
+
+# Last accepted scan per plate as (action, timestamp), so /track can infer
+# the next action and drop double taps without reading Movement. Misses
+# fall back to Presence. Each server process keeps its own copy.
+plate_state = TTLCache(app.config['SCAN_CACHE_SIZE'], app.config['SCAN_CACHE_TTL'])
+plate_state_lock = threading.Lock()
+scans_debounced = Counter('scans_debounced_total', 'Repeat scans answered without being recorded.')
+
+# Outcome of recently seen idempotency keys, so a replayed scan is answered
+# from memory. The unique index on movement.idempotency_key still catches
+# replays after a key expires here or the server restarts.
+recent_keys = TTLCache(app.config['IDEMPOTENCY_CACHE_SIZE'], app.config['IDEMPOTENCY_CACHE_TTL'])
+scans_replayed = Counter('scans_replayed_total', 'Scans answered from a known idempotency key.')
+
+def replayed_scan(key, outcome):
+    scans_replayed.inc()
+    return jsonify({'status': 'duplicate', 'idempotency_key': key, 'plate': outcome.get('plate'),
+                    'action': outcome.get('action'), 'message': 'Scan already recorded'})
+
+def load_plate_state(plate):
+    presence = db.session.get(Presence, plate)
+    return (presence.last_action, presence.last_timestamp) if presence else None
+
+def claim_scan(plate, action, now):
+    # Returns (action, suppressed). 'auto' becomes the opposite of the last
+    # action. Within the debounce window an auto scan, or a repeat of the
+    # last action, is suppressed and answered with the last action. now is
+    # the scan's own time, so queued scans replayed together are not taken
+    # for double taps.
+    state = plate_state.get(plate)
+    if state is None:
+        state = load_plate_state(plate)
+    window = datetime.timedelta(seconds=app.config['SCAN_DEBOUNCE_SECONDS'])
+    with plate_state_lock:
+        # Another request may have claimed a scan since we looked
+        state = plate_state.get(plate) or state
+        last_action, last_at = state or (None, None)
+        if action == 'auto':
+            action = 'exit' if last_action == 'entry' else 'entry'
+            repeat = last_action is not None
+        else:
+            repeat = action == last_action
+        if repeat and window and datetime.timedelta(0) <= now - last_at < window:
+            scans_debounced.inc()
+            plate_state.set(plate, state)
+            return last_action, True
+        # As in update_presence, a late upload of an older scan keeps the newer state
+        plate_state.set(plate, state if last_at and now < last_at else (action, now))
+        return action, False
+
+def update_presence(rows):
+    # Upsert each plate's latest movement; late uploads of older scans
+    # (e.g. from /track/batch) never overwrite newer state
+    stmt = sqlite_insert(Presence)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Presence.plate],
+        set_={'last_action': stmt.excluded.last_action,
+              'last_timestamp': stmt.excluded.last_timestamp,
+              'gate': stmt.excluded.gate},
+        where=stmt.excluded.last_timestamp >= Presence.last_timestamp)
+    db.session.execute(stmt, [{'plate': r['plate'], 'last_action': r['action'],
+                               'last_timestamp': r['timestamp'], 'gate': r.get('gate')} for r in rows])
+
+movement_hub = BroadcastHub(app.config['SSE_BUFFER_SIZE'], app.config['SSE_MAX_CLIENTS'])
+
+def movement_event(row):
+    return {'id': row.id, 'plate': row.plate, 'action': row.action, 'gate': row.gate,
+            'timestamp': to_nairobi(row.timestamp).strftime('%Y-%m-%d %H:%M:%S')}
+
+def record_movements(rows):
+    # Single write path for scans, used directly in sync mode and by the
+    # background writer in batched mode
+    inserted = db.session.execute(
+        db.insert(Movement).returning(Movement.id, Movement.plate, Movement.action,
+                                      Movement.timestamp, Movement.gate, sort_by_parameter_order=True),
+        rows).all()
+    pair_visits(inserted)
+    update_presence(rows)
+    db.session.commit()
+    # Only announce rows once they are committed
+    for row in inserted:
+        movement_hub.publish(movement_event(row))
+
+def rebuild_presence(chunk_size=1000):
+    # Recreate Presence from Movement in one pass sorted by plate, keeping
+    # only the last movement of each plate
+    Presence.query.delete()
+    rows = (db.session.query(Movement.plate, Movement.action, Movement.timestamp, Movement.gate)
+            .order_by(Movement.plate, Movement.timestamp, Movement.id).yield_per(chunk_size))
+    batch, last, total = [], None, 0
+    # A trailing None flushes the last plate
+    for row in itertools.chain(rows, [None]):
+        if last is not None and (row is None or row.plate != last.plate):
+            batch.append({'plate': last.plate, 'last_action': last.action,
+                          'last_timestamp': last.timestamp, 'gate': last.gate})
+            if len(batch) >= chunk_size or row is None:
+                db.session.execute(db.insert(Presence), batch)
+                total += len(batch)
+                batch = []
+        last = row
+    db.session.commit()
+    return total
+
+def pair_movements(rows, open_visits=None):
+    # Walk movements sorted by plate, timestamp and id and yield visit dicts.
+    # open_visits ({plate: dict}) continues visits already stored; those
+    # keep their id so the caller updates rather than inserts them.
+    open_visits = dict(open_visits or {})
+    current = last_plate = None
+    for row in itertools.chain(rows, [None]):
+        if row is None or row.plate != last_plate:
+            if current is not None:
+                yield current
+            if row is None:
+                return
+            current, last_plate = open_visits.pop(row.plate, None), row.plate
+        if row.action == 'entry':
+            if current is not None:
+                current['status'] = 'missing_exit'
+                yield current
+            current = {'plate': row.plate, 'status': 'open', 'entry_id': row.id, 'entered_at': row.timestamp,
+                       'exit_id': None, 'exited_at': None}
+        elif current is not None:
+            current.update(status='closed', exit_id=row.id, exited_at=row.timestamp)
+            yield current
+            current = None
+        else:
+            yield {'plate': row.plate, 'status': 'orphan_exit', 'entry_id': None, 'entered_at': None,
+                   'exit_id': row.id, 'exited_at': row.timestamp}
+
+def write_visits(visits, institutions=None):
+    inserts, updates = [], []
+    for visit in visits:
+        visit['day'] = to_nairobi(visit['entered_at'] or visit['exited_at']).date()
+        if institutions is not None:
+            visit['institution'] = institutions.get(visit['plate']) or 'Unknown'
+        else:
+            visit.setdefault('institution', None)
+        visit['duration_seconds'] = None
+        if visit['status'] == 'closed':
+            visit['duration_seconds'] = round((visit['exited_at'] - visit['entered_at']).total_seconds())
+        (updates if visit.get('id') else inserts).append(visit)
+    if inserts:
+        db.session.execute(db.insert(Visit), inserts)
+    if updates:
+        db.session.execute(db.update(Visit), updates)
+    return len(inserts) + len(updates)
+
+def load_open_visits(plates):
+    rows = (db.session.query(*Visit.__table__.columns)
+            .filter(Visit.plate.in_(plates), Visit.status == 'open').all())
+    return {row.plate: row._asdict() for row in rows}
+
+def repair_visits(plate, since):
+    # A movement older than the plate's latest arrived (late batch upload).
+    # Every exit ends a visit, so pairing restarts after the last exit
+    # before it and the visits built from later movements are replaced.
+    boundary = (db.session.query(Movement.timestamp, Movement.id)
+                .filter(Movement.plate == plate, Movement.action == 'exit', Movement.timestamp < since)
+                .order_by(Movement.timestamp.desc(), Movement.id.desc()).first())
+    query = db.session.query(Movement.id, Movement.plate, Movement.action, Movement.timestamp).filter(
+        Movement.plate == plate, Movement.timestamp.isnot(None))
+    if boundary:
+        query = query.filter(db.tuple_(Movement.timestamp, Movement.id) > tuple(boundary))
+    ids = query.with_entities(Movement.id).scalar_subquery()
+    db.session.execute(db.delete(Visit).where(Visit.plate == plate,
+                                              db.or_(Visit.entry_id.in_(ids), Visit.exit_id.in_(ids))))
+    rows = query.order_by(Movement.timestamp, Movement.id).all()
+    return write_visits(pair_movements(rows, load_open_visits([plate])))
+
+def pair_visits(inserted):
+    # Pair newly inserted movements into visits. Runs before
+    # update_presence() so Presence still shows which rows arrived late.
+    # Nothing here reads Registration, so signed scans stay lookup-free.
+    plates = {row.plate for row in inserted}
+    latest = dict(db.session.query(Presence.plate, Presence.last_timestamp).filter(Presence.plate.in_(plates)).all())
+    late = {}
+    for row in inserted:
+        if latest.get(row.plate) and row.timestamp < latest[row.plate]:
+            late[row.plate] = min(row.timestamp, late.get(row.plate, row.timestamp))
+    for plate, since in late.items():
+        repair_visits(plate, since)
+    rows = sorted((row for row in inserted if row.plate not in late), key=lambda r: (r.plate, r.timestamp, r.id))
+    if rows:
+        write_visits(pair_movements(rows, load_open_visits(plates - late.keys())))
+
+def rebuild_visits(chunk_size=5000):
+    # Recreate Visit from Movement in one pass sorted by plate and time
+    Visit.query.delete()
+    institutions = dict(db.session.query(Registration.plate, Registration.institution).all())
+    rows = (db.session.query(Movement.id, Movement.plate, Movement.action, Movement.timestamp)
+            .filter(Movement.timestamp.isnot(None))
+            .order_by(Movement.plate, Movement.timestamp, Movement.id).yield_per(chunk_size))
+    visits = pair_movements(rows)
+    total = 0
+    while True:
+        batch = list(itertools.islice(visits, chunk_size))
+        if not batch:
+            break
+        total += write_visits(batch, institutions)
+    db.session.commit()
+    return total
+
+def fill_visit_institutions():
+    # Run before dwell queries; only visits written since the last call
+    # are still empty
+    institution = (db.select(Registration.institution).where(Registration.plate == Visit.plate)
+                   .limit(1).scalar_subquery())
+    db.session.execute(db.update(Visit).where(Visit.institution.is_(None))
+                       .values(institution=db.func.coalesce(institution, 'Unknown'))
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+
+def vehicles_on_site():
+    return (Presence.query.filter_by(last_action='entry')
+            .order_by(Presence.last_timestamp.desc()).all())
+
+def log_rejected_scan(plate, reason, gate=None):
+    # Input for the repeated-rejection alert rule
+    db.session.add(RejectedScan(plate=plate, reason=reason, gate=gate, timestamp=datetime.datetime.utcnow()))
+    db.session.commit()
+
+def write_movement_batch(rows):
+    with app.app_context():
+        try:
+            record_movements(rows)
+        except IntegrityError:
+            # A replayed idempotency key that was no longer in recent_keys;
+            # drop the rows already stored instead of failing the batch
+            db.session.rollback()
+            keys = {r['idempotency_key'] for r in rows if r.get('idempotency_key')}
+            stored = {k for (k,) in db.session.query(Movement.idempotency_key).filter(Movement.idempotency_key.in_(keys))}
+            rows = [r for r in rows if r.get('idempotency_key') not in stored]
+            if rows:
+                record_movements(rows)
+
+movement_writer = BatchWriter(write_movement_batch,
+                              max_batch=app.config['INGEST_BATCH_SIZE'],
+                              max_delay=app.config['INGEST_MAX_DELAY_MS'] / 1000,
+                              maxsize=app.config['INGEST_QUEUE_SIZE'])
+atexit.register(movement_writer.stop)
+
+qr_cache = QRCache(app.config['QR_CACHE_DIR'], app.config['QR_CACHE_SIZE'])
+
+import_jobs = TTLCache(100, ttl=3600)
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            _render_pool = ProcessPoolExecutor(app.config['QR_RENDER_WORKERS'])
+            atexit.register(_render_pool.shutdown)
+        return _render_pool
+
 @app.route('/admin-login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
@@ -78,14 +830,28 @@ def manage_devices():
         new_device = AuthorizedDevice(mac_address=mac_address, token=token)
         db.session.add(new_device)
         db.session.commit()
+        device_cache.clear()
         flash(f'Device added successfully with token: {token}', 'success')
         return redirect('/admin/devices')
     devices = AuthorizedDevice.query.all()
     return render_template('admin_devices.html', devices=devices)
 
+@app.route('/admin/devices/<int:id>/rotate', methods=['POST'])
+def rotate_device_token(id):
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    device = db.get_or_404(AuthorizedDevice, id)
+    device.token = secrets.token_urlsafe(32)
+    db.session.commit()
+    # The old token must stop working; QR codes are signed and don't embed it
+    device_cache.clear()
+    flash(f'Token rotated for {device.mac_address}: {device.token}', 'success')
+    return redirect('/admin/devices')
+
 @app.route('/logout')
 def logout():
     session.pop('admin', None)
+    session.pop('elevated_until', None)
     flash('Logged out successfully', 'info')
     return redirect('/admin-login')
 
@@ -104,15 +870,108 @@ def reset_password():
     return render_template('reset_password.html')
 
 def send_reset_email(to_email, token):
-    msg = EmailMessage()
-    msg['Subject'] = 'Password Reset'
-    msg['From'] = 'noreply@judiciary.go.ke'
-    msg['To'] = to_email
-    msg.set_content(f'Click the link to reset your password: https://yourdomain.com/reset/{token}')
-    with smtplib.SMTP('smtp.gmail.com', 587) as smtp:
-        smtp.starttls()
-        smtp.login(os.getenv('EMAIL_USER'), os.getenv('EMAIL_PASS'))
-        smtp.send_message(msg)
+    queue_email(to_email, 'Password Reset',
+                f'Click the link to reset your password: https://yourdomain.com/reset/{token}')
+
+smtp_pool = SMTPPool(app.config['SMTP_HOST'], app.config['SMTP_PORT'],
+                     os.getenv('EMAIL_USER'), os.getenv('EMAIL_PASS'), starttls=app.config['SMTP_STARTTLS'])
+mail_wakeup = threading.Event()
+_mail_worker = None
+
+def queue_email(to_email, subject, body):
+    # Persist first, then let the worker deliver outside the request
+    db.session.add(Outbox(to_email=to_email, subject=subject, body=body))
+    db.session.commit()
+    start_mail_worker()
+    mail_wakeup.set()
+
+def deliver_outbox(limit=50):
+    # One pass over due mail; failures are rescheduled with exponential backoff
+    now = datetime.datetime.utcnow()
+    due = (Outbox.query.filter(Outbox.status == 'pending', Outbox.next_attempt_at <= now)
+           .order_by(Outbox.id).limit(limit).all())
+    for mail in due:
+        msg = EmailMessage()
+        msg['Subject'] = mail.subject
+        msg['From'] = app.config['MAIL_FROM']
+        msg['To'] = mail.to_email
+        msg.set_content(mail.body)
+        try:
+            smtp_pool.send(msg)
+            mail.status = 'sent'
+            mail.sent_at = datetime.datetime.utcnow()
+        except Exception as e:
+            mail.attempts += 1
+            mail.last_error = str(e)[:255]
+            if mail.attempts >= app.config['MAIL_MAX_ATTEMPTS']:
+                mail.status = 'failed'
+                app.logger.error('Giving up on email %s to %s: %s', mail.id, mail.to_email, e)
+            else:
+                mail.next_attempt_at = now + datetime.timedelta(seconds=backoff(mail.attempts, app.config['MAIL_RETRY_BASE']))
+        db.session.commit()
+    return len(due)
+
+def _run_mail_worker():
+    while True:
+        mail_wakeup.clear()
+        try:
+            with app.app_context():
+                delivered = deliver_outbox()
+        except Exception:
+            app.logger.exception('Mail worker pass failed')
+            delivered = 0
+        if not delivered:
+            smtp_pool.close_if_idle()
+            mail_wakeup.wait(app.config['MAIL_POLL_INTERVAL'])
+
+def start_mail_worker():
+    global _mail_worker
+    if _mail_worker is None or not _mail_worker.is_alive():
+        _mail_worker = threading.Thread(target=_run_mail_worker, name='mail-worker', daemon=True)
+        _mail_worker.start()
+
+_snapshot_worker = None
+
+def refresh_reporting_snapshot():
+    with timed('reporting_snapshot'):
+        conn = db.engine.raw_connection()
+        try:
+            snapshot.take_snapshot(conn.driver_connection, app.config['REPORTING_DB'])
+        finally:
+            conn.close()
+
+_alert_worker = None
+
+def _run_alert_worker():
+    while True:
+        try:
+            with app.app_context():
+                evaluate_alerts()
+                deliver_alert_webhooks()
+        except Exception:
+            app.logger.exception('Alert worker pass failed')
+        time.sleep(app.config['ALERT_INTERVAL'])
+
+def start_alert_worker():
+    global _alert_worker
+    if _alert_worker is None or not _alert_worker.is_alive():
+        _alert_worker = threading.Thread(target=_run_alert_worker, name='alert-worker', daemon=True)
+        _alert_worker.start()
+
+def _run_snapshot_worker():
+    while True:
+        try:
+            with app.app_context():
+                refresh_reporting_snapshot()
+        except Exception:
+            app.logger.exception('Reporting snapshot failed')
+        time.sleep(app.config['REPORTING_REFRESH_SECONDS'])
+
+def start_snapshot_worker():
+    global _snapshot_worker
+    if _snapshot_worker is None or not _snapshot_worker.is_alive():
+        _snapshot_worker = threading.Thread(target=_run_snapshot_worker, name='reporting-snapshot', daemon=True)
+        _snapshot_worker.start()
 
 @app.route('/register', methods=['GET', 'POST'])
 def register_vehicle():
@@ -129,55 +988,231 @@ def register_vehicle():
             new_vehicle = Registration(plate=plate, owner=owner, institution=institution)
             db.session.add(new_vehicle)
             db.session.commit()
+            plate_cache.invalidate(plate)
             flash('Vehicle registered successfully.', 'success')
     return render_template('register.html')
 
+def qr_scan_url(vehicle):
+    # URL encoded in a vehicle's QR code, carrying its signed scan code
+    base_url = os.getenv('BASE_URL')
+    if not base_url:
+        base_url = request.host_url.rstrip('/')
+    return f"{base_url}/scan-qr?code={scan_code(vehicle)}"
+
 @app.route('/generate-qr/<plate>')
 def generate_qr(plate):
     if 'admin' not in session:
         return redirect('/admin-login')
-    # Generate QR code encoding the URL to scan and verify the plate with token
-    base_url = os.getenv('BASE_URL')
-    if not base_url:
-        base_url = request.host_url.rstrip('/')
-    print(f"Generating QR code with base_url: {base_url}")
-    # For demo, get the first authorized device token
-    device = AuthorizedDevice.query.first()
-    token = device.token if device else ''
-    qr_url = f"{base_url}/scan-qr?plate={plate}&token={token}"
-    img = qrcode.make(qr_url)
-    buf = io.BytesIO()
-    img.save(buf)
-    buf.seek(0)
-    return send_file(buf, mimetype='image/png')
+    vehicle = Registration.query.filter_by(plate=plate.upper()).first()
+    if vehicle is None:
+        return "Vehicle not registered", 404
+    qr_url = qr_scan_url(vehicle)
+    # The ETag is derived from the URL alone, so a revalidation never renders
+    etag = QRCache.key(qr_url)
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        etag, png = qr_cache.get(qr_url)
+        response = app.response_class(png, mimetype='image/png')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"private, max-age={app.config['QR_MAX_AGE']}"
+    return response
 
 @app.route('/track/<plate>/<action>')
 def track_movement(plate, action):
+    code = request.args.get('code')
     token = request.args.get('token')
-    if not token:
+    if code:
+        # A signed code vouches for both the scan and the registration
+        code_plate, error = check_scan_code(code, plate)
+        if error:
+            if code_plate:
+                log_rejected_scan(code_plate, 'invalid_code', request.args.get('gate'))
+            return jsonify({'error': f'Access denied: {error}'}), 403
+    elif not token:
         return jsonify({'error': 'Access denied: No token provided'}), 403
-    authorized_device = AuthorizedDevice.query.filter_by(token=token).first()
-    if not authorized_device:
+    elif not is_authorized_token(token):
         return jsonify({'error': 'Access denied: Invalid token'}), 403
-    if action not in ['entry', 'exit']:
+    if action not in ['entry', 'exit', 'auto']:
         return jsonify({'error': 'Invalid action'}), 400
     # Check if vehicle is registered
-    vehicle = Registration.query.filter_by(plate=plate.upper()).first()
-    if not vehicle:
+    if not code and not is_registered_plate(plate):
+        log_rejected_scan(plate.upper(), 'not_registered', request.args.get('gate'))
         return jsonify({'status': 'error', 'message': 'Vehicle not registered'}), 404
-    log = Movement(plate=plate.upper(), action=action)
-    db.session.add(log)
-    db.session.commit()
+    # Retrying clients send the same key, so a scan is recorded at most once
+    key = request.headers.get('Idempotency-Key') or request.args.get('idempotency_key') or None
+    if key and len(key) > 64:
+        return jsonify({'error': 'idempotency_key is limited to 64 characters'}), 400
+    try:
+        # Queued scans replayed later keep the time they were made
+        timestamp = parse_client_timestamp(request.args.get('client_timestamp'))
+    except ValueError:
+        return jsonify({'error': 'Invalid client_timestamp'}), 400
+    if key:
+        outcome = recent_keys.get(key)
+        if outcome is not None:
+            return replayed_scan(key, outcome)
+        if not recent_keys.add(key, {'plate': plate.upper()}):
+            # A concurrent retry with the same key got there first
+            return replayed_scan(key, recent_keys.get(key) or {})
+    action, suppressed = claim_scan(plate.upper(), action, timestamp)
+    if suppressed:
+        if key:
+            recent_keys.set(key, {'plate': plate.upper(), 'action': action})
+        return jsonify({'status': 'duplicate', 'plate': plate, 'action': action,
+                        'message': f'Already marked for {action}, scan ignored'})
+    row = {'plate': plate.upper(), 'action': action, 'timestamp': timestamp, 'gate': request.args.get('gate'),
+           'idempotency_key': key}
+    if app.config['INGEST_MODE'] == 'batched':
+        if not movement_writer.submit(row):
+            plate_state.invalidate(row['plate'])
+            if key:
+                recent_keys.invalidate(key)
+            return jsonify({'status': 'error', 'message': 'Server busy, please retry'}), 503
+        if key:
+            recent_keys.set(key, {'plate': row['plate'], 'action': action})
+        return jsonify({'status': 'queued', 'plate': plate, 'action': action}), 202
+    try:
+        record_movements([row])
+    except IntegrityError:
+        # The key was recorded before this process saw it (e.g. before a restart)
+        db.session.rollback()
+        plate_state.invalidate(row['plate'])
+        existing = Movement.query.filter_by(idempotency_key=key).first()
+        outcome = {'plate': existing.plate, 'action': existing.action}
+        recent_keys.set(key, outcome)
+        return replayed_scan(key, outcome)
+    except Exception:
+        db.session.rollback()
+        plate_state.invalidate(row['plate'])
+        if key:
+            recent_keys.invalidate(key)
+        raise
+    if key:
+        recent_keys.set(key, {'plate': row['plate'], 'action': action})
     return jsonify({'status': 'success', 'plate': plate, 'action': action})
 
+def parse_client_timestamp(value):
+    # ISO 8601 from the device; naive values are taken as UTC
+    if not value:
+        return datetime.datetime.utcnow()
+    ts = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(pytz.utc).replace(tzinfo=None)
+    if ts > datetime.datetime.utcnow() + datetime.timedelta(minutes=5):
+        raise ValueError('timestamp in the future')
+    return ts
+
+def batch_record_error(record):
+    # Shape checks for one uploaded record, before anything reaches the database
+    if not isinstance(record, dict):
+        return 'Record must be an object'
+    plate, key, gate = record.get('plate'), record.get('idempotency_key'), record.get('gate')
+    if not isinstance(plate, str) or not plate or record.get('action') not in ('entry', 'exit'):
+        return 'Plate and a valid action are required'
+    if len(plate) > 20:
+        return 'plate is limited to 20 characters'
+    if key is not None and (not isinstance(key, str) or len(key) > 64):
+        return 'idempotency_key must be a string of at most 64 characters'
+    if gate is not None and (not isinstance(gate, str) or len(gate) > 50):
+        return 'gate must be a string of at most 50 characters'
+    if record.get('client_timestamp') is not None and not isinstance(record['client_timestamp'], str):
+        return 'client_timestamp must be an ISO 8601 string'
+    return None
+
+def check_batch_records(records):
+    # Returns (rows to insert, per-record results) using one query for plates
+    # and one for idempotency keys
+    errors = [batch_record_error(r) for r in records]
+    valid = [r for r, error in zip(records, errors) if error is None]
+    plates = {r['plate'].upper() for r in valid}
+    registered = {p for (p,) in db.session.query(Registration.plate).filter(Registration.plate.in_(plates))}
+    keys = {r['idempotency_key'] for r in valid if r.get('idempotency_key')}
+    seen = {k for (k,) in db.session.query(Movement.idempotency_key).filter(Movement.idempotency_key.in_(keys))}
+    # Includes keys /track has accepted but the batch writer not yet stored
+    seen.update(k for k in keys if recent_keys.get(k) is not None)
+    rows, results = [], []
+    for index, (record, error) in enumerate(zip(records, errors)):
+        if error:
+            results.append({'index': index, 'status': 'invalid', 'message': error})
+            continue
+        key = record.get('idempotency_key') or None
+        result = {'index': index, 'idempotency_key': key}
+        results.append(result)
+        plate = record['plate'].upper()
+        action = record['action']
+        try:
+            timestamp = parse_client_timestamp(record.get('client_timestamp'))
+        except (TypeError, ValueError):
+            result.update(status='invalid', message='Invalid client_timestamp')
+            continue
+        if key in seen:
+            result['status'] = 'duplicate'
+            continue
+        if plate not in registered:
+            result.update(status='not_registered', message='Vehicle not registered')
+            continue
+        if key:
+            seen.add(key)
+        rows.append({'plate': plate, 'action': action, 'timestamp': timestamp,
+                     'idempotency_key': key, 'gate': record.get('gate')})
+        result['status'] = 'accepted'
+    return rows, results
+
+@app.route('/track/batch', methods=['POST'])
+def track_batch():
+    token = request.args.get('token')
+    if not token:
+        return jsonify({'error': 'Access denied: No token provided'}), 403
+    if not is_authorized_token(token):
+        return jsonify({'error': 'Access denied: Invalid token'}), 403
+    data = request.get_json(silent=True)
+    records = data.get('records') if isinstance(data, dict) else data
+    if not isinstance(records, list):
+        return jsonify({'error': 'Expected a JSON array of records'}), 400
+    if len(records) > app.config['TRACK_BATCH_MAX']:
+        return jsonify({'error': f"At most {app.config['TRACK_BATCH_MAX']} records per batch"}), 413
+    # A concurrent upload may claim one of our idempotency keys between the
+    # check and the insert; re-check once and retry
+    for attempt in range(2):
+        rows, results = check_batch_records(records)
+        try:
+            if rows:
+                record_movements(rows)
+                # Uploaded scans may be newer than what /track last saw
+                for row in rows:
+                    plate_state.invalidate(row['plate'])
+                    if row['idempotency_key']:
+                        recent_keys.set(row['idempotency_key'], {'plate': row['plate'], 'action': row['action']})
+            break
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                return jsonify({'error': 'Conflicting concurrent upload, please retry'}), 409
+    rejected = [records[r['index']] for r in results if r['status'] == 'not_registered']
+    if rejected:
+        now = datetime.datetime.utcnow()
+        db.session.execute(db.insert(RejectedScan), [
+            {'plate': r['plate'].upper(), 'reason': 'not_registered', 'gate': r.get('gate'), 'timestamp': now}
+            for r in rejected])
+        db.session.commit()
+    accepted = sum(1 for r in results if r['status'] == 'accepted')
+    return jsonify({'status': 'success', 'accepted': accepted, 'results': results})
+
 @app.route('/scan-qr')
 def scan_qr():
+    code = request.args.get('code')
+    if code:
+        plate, error = check_scan_code(code)
+        if error:
+            return f"Access denied: {error}", 403
+        return render_template('scan_qr.html', plate=plate, token='', code=code)
+    # Stickers printed before signed codes carry the plate and a device token
     plate = request.args.get('plate')
     token = request.args.get('token')
     if not plate or not token:
         return "Missing plate or token", 400
-    authorized_device = AuthorizedDevice.query.filter_by(token=token).first()
-    if not authorized_device:
+    if not is_authorized_token(token):
         return "Access denied: Invalid token", 403
     return render_template('scan_qr.html', plate=plate, token=token)
 
@@ -206,49 +1241,205 @@ def dashboard():
             )
             db.session.add(new_vehicle)
             db.session.commit()
+            if new_vehicle.plate:
+                plate_cache.invalidate(new_vehicle.plate)
             # Generate and save QR code
             if plate:
-                base_url = os.getenv('BASE_URL')
-                if not base_url:
-                    base_url = request.host_url.rstrip('/')
-                device = AuthorizedDevice.query.first()
-                token = device.token if device else ''
-                qr_url = f"{base_url}/scan-qr?plate={plate}&token={token}"
-                img = qrcode.make(qr_url)
-                qr_filename = f"{plate}.png"
-                qr_path = f"static/{qr_filename}"
-                img.save(qr_path)
+                _, png = qr_cache.get(qr_scan_url(new_vehicle))
+                qr_path = f"static/{qr_filename(plate)}"
+                with open(qr_path, 'wb') as f:
+                    f.write(png)
                 new_vehicle.qr_path = qr_path
                 db.session.commit()
             message = f"Vehicle with plate number {plate} registered successfully. QR code generated."
 
-    return render_template('dashboard.html', message=message)
+    open_alerts = db.session.query(db.func.count(Alert.id)).filter(Alert.acknowledged_at.is_(None)).scalar()
+    return render_template('dashboard.html', message=message, on_site=vehicles_on_site(), open_alerts=open_alerts)
+
+def check_import_rows(rows):
+    # Validate every row against the file itself and, with one IN query per
+    # column, against existing registrations
+    pj_numbers = {r['pj_number'] for _, r in rows if r['pj_number']}
+    plates = {r['plate'].upper() for _, r in rows if r['plate']}
+    taken_pj = {p for (p,) in db.session.query(Registration.pj_number).filter(Registration.pj_number.in_(pj_numbers))}
+    taken_plates = {p for (p,) in db.session.query(Registration.plate).filter(Registration.plate.in_(plates))}
+    accepted, report = [], []
+    for line, row in rows:
+        pj_number, plate = row['pj_number'], row['plate'].upper()
+        if not pj_number or not plate:
+            report.append({'row': line, 'status': 'invalid', 'message': 'PJ number and plate are required'})
+        elif pj_number in taken_pj:
+            report.append({'row': line, 'status': 'duplicate', 'message': f'PJ Number {pj_number} is already registered'})
+        elif plate in taken_plates:
+            report.append({'row': line, 'status': 'duplicate', 'message': f'Plate {plate} is already registered'})
+        else:
+            taken_pj.add(pj_number)
+            taken_plates.add(plate)
+            accepted.append((line, row))
+            report.append({'row': line, 'status': 'accepted', 'pj_number': pj_number, 'plate': plate})
+    return accepted, report
+
+def qr_filename(plate):
+    # Plates come from forms and uploaded files, so keep them inside static/
+    return secure_filename(f"{plate}.png")
+
+def render_import_qr_codes(job, items):
+    # items are (registration id, plate, scan url); PNGs are rendered in the
+    # process pool and written to static/ from this thread
+    updates = []
+    futures = {get_render_pool().submit(render_png, url): (id, plate, url) for id, plate, url in items}
+    for future in as_completed(futures):
+        id, plate, url = futures[future]
+        try:
+            png = future.result()
+            qr_cache.store(url, png)
+            with open(os.path.join(app.static_folder, qr_filename(plate)), 'wb') as f:
+                f.write(png)
+            updates.append({'id': id, 'qr_path': f"static/{qr_filename(plate)}"})
+            job.advance()
+        except Exception:
+            app.logger.exception('QR rendering failed for %s', plate)
+            job.advance(ok=False)
+    with app.app_context():
+        if updates:
+            db.session.execute(db.update(Registration), updates)
+            db.session.commit()
+    job.finish()
+
+@app.route('/import-vehicles', methods=['POST'])
+def import_vehicles():
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'Choose a CSV or XLSX file to import'}), 400
+    try:
+        rows = list(read_rows(upload.filename, upload.stream))
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+    if len(rows) > app.config['IMPORT_MAX_ROWS']:
+        return jsonify({'error': f"At most {app.config['IMPORT_MAX_ROWS']} rows per import"}), 413
+    accepted, report = check_import_rows(rows)
+    vehicles = [Registration(pj_number=row['pj_number'],
+                             plate=row['plate'].upper(),
+                             owner=row['driver_name'],
+                             institution=row['phone_number'])  # As in dashboard: phone number kept in institution
+                for _, row in accepted]
+    try:
+        db.session.add_all(vehicles)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Registrations changed during the import, please retry'}), 409
+    for vehicle in vehicles:
+        plate_cache.invalidate(vehicle.plate)
+    items = [(v.id, v.plate, qr_scan_url(v)) for v in vehicles]
+    job = ImportJob(report, len(items))
+    import_jobs.set(job.id, job)
+    if items:
+        os.makedirs(app.static_folder, exist_ok=True)
+        threading.Thread(target=render_import_qr_codes, args=(job, items), daemon=True).start()
+    return jsonify(dict(job.progress(), imported=len(vehicles), report=report)), 202
+
+@app.route('/import-vehicles/<job_id>')
+def import_progress(job_id):
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    job = import_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired import job'}), 404
+    return jsonify(dict(job.progress(), report=job.report))
+
+def is_elevated():
+    return 'admin' in session and session.get('elevated_until', 0) > time.time()
+
+def elevate_session():
+    if app.config['ELEVATION_WINDOW'] > 0:
+        session['elevated_until'] = time.time() + app.config['ELEVATION_WINDOW']
 
 @app.route('/delete/<int:id>', methods=['POST'])
 def delete_vehicle(id):
     if 'admin' not in session:
         return redirect('/admin-login')
-    admin_username = session['admin']
-    admin = Admin.query.filter_by(username=admin_username).first()
-    if not admin:
-        flash('Admin user not found.', 'danger')
-        return redirect('/view-vehicles')
-    password = request.form.get('admin_password')
-    if not password:
-        flash('Password is required to delete a vehicle.', 'danger')
-        return redirect('/view-vehicles')
-    if not admin.check_password(password):
-        flash('Invalid admin password.', 'danger')
-        return redirect('/view-vehicles')
+    if not is_elevated():
+        admin_username = session['admin']
+        admin = Admin.query.filter_by(username=admin_username).first()
+        if not admin:
+            flash('Admin user not found.', 'danger')
+            return redirect('/view-vehicles')
+        password = request.form.get('admin_password')
+        if not password:
+            flash('Password is required to delete a vehicle.', 'danger')
+            return redirect('/view-vehicles')
+        if not admin.check_password(password):
+            flash('Invalid admin password.', 'danger')
+            return redirect('/view-vehicles')
+        elevate_session()
     try:
         vehicle = Registration.query.get_or_404(id)
         db.session.delete(vehicle)
+        revoke_codes([id])
         db.session.commit()
+        revocations.clear()
+        registration_plates.invalidate(id)
+        plate_cache.invalidate(vehicle.plate)
+        plate_state.invalidate(vehicle.plate)
         flash('Vehicle deleted successfully.', 'success')
     except Exception:
         flash('An error occurred while deleting the vehicle.', 'danger')
     return redirect('/view-vehicles')
 
+@app.route('/vehicles/<int:id>/revoke-qr', methods=['POST'])
+def revoke_qr(id):
+    # For a lost or copied sticker: every code printed so far stops working
+    # and the next QR generated for the vehicle is a new one
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    vehicle = db.get_or_404(Registration, id)
+    revoke_codes([vehicle.id])
+    db.session.commit()
+    revocations.clear()
+    flash(f'QR codes for {vehicle.plate} revoked. Print a new QR code for this vehicle.', 'success')
+    return redirect('/view-vehicles')
+
+@app.route('/vehicles/bulk-delete', methods=['POST'])
+def bulk_delete_vehicles():
+    # Remove many registrations and their movements in one transaction
+    if 'admin' not in session:
+        return jsonify({'success': False, 'message': 'Login required.'}), 401
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+        return jsonify({'success': False, 'message': 'A list of vehicle ids is required.'}), 400
+    if len(ids) > app.config['BULK_DELETE_MAX']:
+        return jsonify({'success': False, 'message': f"At most {app.config['BULK_DELETE_MAX']} vehicles at a time."}), 413
+    if not is_elevated():
+        admin = Admin.query.filter_by(username=session['admin']).first()
+        if not admin or not admin.check_password(data.get('password', '')):
+            return jsonify({'success': False, 'message': 'Incorrect admin password.'}), 403
+        elevate_session()
+    try:
+        found = db.session.query(Registration.id, Registration.plate).filter(Registration.id.in_(ids)).all()
+        plates = [plate for _, plate in found]
+        deleted = db.session.execute(db.delete(Registration).where(Registration.id.in_(ids))).rowcount
+        # Printed codes verify without the database, so they must be revoked
+        revoke_codes([id for id, _ in found])
+        movements = db.session.execute(db.delete(Movement).where(Movement.plate.in_(plates))).rowcount
+        db.session.execute(db.delete(Presence).where(Presence.plate.in_(plates)))
+        db.session.execute(db.delete(Visit).where(Visit.plate.in_(plates)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Error deleting vehicles.'}), 500
+    revocations.clear()
+    for id, _ in found:
+        registration_plates.invalidate(id)
+    for plate in plates:
+        plate_cache.invalidate(plate)
+        plate_state.invalidate(plate)
+    return jsonify({'success': True, 'deleted': deleted, 'movements_deleted': movements,
+                    'message': f'{deleted} vehicles and {movements} movements deleted.'})
+
 
 
 @app.route('/test-post', methods=['POST'])
@@ -261,35 +1452,731 @@ def test_post():
 from flask import get_flashed_messages
 
 @app.route('/view-vehicles')
+@reads_snapshot
 def view_vehicles():
     if 'admin' not in session:
         return redirect('/admin-login')
     # Clear any existing flash messages to avoid showing stale messages
-    get_flashed_messages()
-    vehicles = Registration.query.order_by(Registration.timestamp.desc()).all()
-    # Convert naive timestamps to aware in UTC, then to Nairobi timezone
-    for vehicle in vehicles:
-        if vehicle.timestamp.tzinfo is None:
-            vehicle.timestamp = pytz.utc.localize(vehicle.timestamp)
-        vehicle.timestamp = vehicle.timestamp.astimezone(nairobi_tz)
-    return render_template('view_vehicles.html', vehicles=vehicles, nairobi_tz=nairobi_tz)
+    flashes = get_flashed_messages()
+    # The page only changes when a registration is added or removed, or the
+    # viewer's re-auth window opens or closes, QR codes are revoked or the
+    # reporting copy is refreshed; pages with flashes are one-off
+    max_id, max_ts, count = db.session.query(db.func.max(Registration.id), db.func.max(Registration.timestamp),
+                                             db.func.count(Registration.id)).one()
+    elevated = is_elevated()
+    revoked = revoked_codes()
+    as_of = data_as_of()
+    etag = hashlib.sha1(f"{max_id}|{max_ts}|{count}|{session['admin']}|{elevated}|"
+                        f"{len(revoked)}|{max(revoked.values(), default=0)}|{as_of and as_of[0]}".encode()).hexdigest()
+    if not flashes and etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        # Plain rows, not ORM objects; the template converts timestamps
+        vehicles = db.session.execute(
+            db.select(Registration.id, Registration.pj_number, Registration.plate, Registration.owner,
+                      Registration.institution, Registration.timestamp)
+            .order_by(Registration.timestamp.desc())).all()
+        response = app.make_response(render_template('view_vehicles.html', vehicles=vehicles, code_issued=code_issued,
+                                                      nairobi_tz=nairobi_tz, elevated=elevated))
+    if not flashes:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.template_filter('nairobi')
+def to_nairobi(ts):
+    # Stored timestamps are naive UTC
+    if ts.tzinfo is None:
+        ts = pytz.utc.localize(ts)
+    return ts.astimezone(nairobi_tz)
+
+def parse_local_date(value):
+    # 'YYYY-MM-DD' in Nairobi time -> naive UTC midnight
+    day = datetime.datetime.strptime(value, '%Y-%m-%d')
+    return nairobi_tz.localize(day).astimezone(pytz.utc).replace(tzinfo=None)
+
+def movement_filters(args):
+    filters = []
+    plate = (args.get('plate') or '').strip().upper()
+    if plate:
+        filters.append(Movement.plate == plate)
+    action = args.get('action')
+    if action in ('entry', 'exit'):
+        filters.append(Movement.action == action)
+    if args.get('date_from'):
+        filters.append(Movement.timestamp >= parse_local_date(args['date_from']))
+    if args.get('date_to'):
+        end = parse_local_date(args['date_to']) + datetime.timedelta(days=1)
+        filters.append(Movement.timestamp < end)
+    return filters
+
+def encode_log_cursor(ts, id):
+    return f"{ts.isoformat()}_{id}"
+
+def decode_log_cursor(cursor):
+    ts, id = cursor.rsplit('_', 1)
+    return datetime.datetime.fromisoformat(ts), int(id)
+
+def movement_page(filters, cursor=None, per_page=50):
+    # Keyset pagination on (timestamp, id), newest first
+    query = db.session.query(Movement.id, Movement.plate, Movement.action, Movement.timestamp).filter(*filters)
+    if cursor:
+        query = query.filter(db.tuple_(Movement.timestamp, Movement.id) < decode_log_cursor(cursor))
+    rows = query.order_by(Movement.timestamp.desc(), Movement.id.desc()).limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_log_cursor(rows[-1].timestamp, rows[-1].id)
+    logs = [{'id': r.id, 'plate': r.plate, 'action': r.action, 'timestamp': to_nairobi(r.timestamp)} for r in rows]
+    return logs, next_cursor
 
 @app.route('/view-logs')
+@reads_snapshot
 def view_logs():
     if 'admin' not in session:
         return redirect('/admin-login')
-    logs = Movement.query.order_by(Movement.timestamp.desc()).all()
-    # Convert naive timestamps to aware in UTC, then to Nairobi timezone
-    for log in logs:
-        if log.timestamp.tzinfo is None:
-            log.timestamp = pytz.utc.localize(log.timestamp)
-        log.timestamp = log.timestamp.astimezone(nairobi_tz)
-    return render_template('view_logs.html', logs=logs, nairobi_tz=nairobi_tz)
+    per_page = max(1, min(request.args.get('per_page', app.config['LOGS_PAGE_SIZE'], type=int), 500))
+    try:
+        filters = movement_filters(request.args)
+        logs, next_cursor = movement_page(filters, request.args.get('cursor'), per_page)
+    except ValueError:
+        return "Invalid filter or cursor", 400
+    # Carry the active filters over to the "older" link
+    filter_args = {k: v for k, v in request.args.items() if k in ('plate', 'action', 'date_from', 'date_to') and v}
+    return render_template('view_logs.html', logs=logs, next_cursor=next_cursor,
+                           filter_args=filter_args, per_page=per_page, nairobi_tz=nairobi_tz)
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: movement\ndata: {json.dumps(event)}\n\n"
+
+def movement_stream(subscriber, plate, action, last_id):
+    try:
+        yield "retry: 3000\n\n"
+        # Rows missed since the browser's last event, e.g. while reconnecting
+        # after being dropped for falling behind
+        if last_id is not None:
+            query = Movement.query.filter(Movement.id > last_id)
+            if plate:
+                query = query.filter(Movement.plate == plate)
+            if action:
+                query = query.filter(Movement.action == action)
+            for row in query.order_by(Movement.id).limit(app.config['SSE_BACKFILL_MAX']):
+                last_id = row.id
+                yield format_sse(movement_event(row))
+            db.session.remove()
+        deadline = time.monotonic() + app.config['SSE_MAX_DURATION']
+        while not subscriber.dropped and time.monotonic() < deadline:
+            event = subscriber.get(min(app.config['SSE_KEEPALIVE'], max(deadline - time.monotonic(), 0)))
+            if event is None:
+                yield ": keepalive\n\n"
+            elif (last_id is None or event['id'] > last_id) and \
+                    (not plate or event['plate'] == plate) and (not action or event['action'] == action):
+                yield format_sse(event)
+    finally:
+        movement_hub.unsubscribe(subscriber)
+
+@app.route('/view-logs/stream')
+def stream_logs():
+    if 'admin' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    last_id = request.headers.get('Last-Event-ID', request.args.get('last_id'))
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+    # Subscribe before the backfill query so no row falls between the two
+    subscriber = movement_hub.subscribe()
+    if subscriber is None:
+        return jsonify({'error': 'Too many live log viewers, please retry later'}), 503
+    plate = (request.args.get('plate') or '').strip().upper()
+    action = request.args.get('action') if request.args.get('action') in ('entry', 'exit') else None
+    response = Response(stream_with_context(movement_stream(subscriber, plate, action, last_id)),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Also covers a client that disconnects before the stream starts
+    response.call_on_close(lambda: movement_hub.unsubscribe(subscriber))
+    return response
+
+def iter_movements(filters, chunk_size):
+    # Oldest first; rows are fetched chunk_size at a time, never all at once
+    query = db.session.query(Movement.id, Movement.plate, Movement.action, Movement.timestamp,
+                             Movement.gate).filter(*filters)
+    return query.order_by(Movement.timestamp, Movement.id).yield_per(chunk_size)
+
+def export_csv(rows, chunk_size):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(['id', 'plate', 'action', 'timestamp', 'gate'])
+    for i, row in enumerate(rows, 1):
+        writer.writerow([row.id, row.plate, row.action, to_nairobi(row.timestamp).isoformat(), row.gate or ''])
+        if i % chunk_size == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def export_ndjson(rows, chunk_size):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({'id': row.id, 'plate': row.plate, 'action': row.action,
+                                 'timestamp': to_nairobi(row.timestamp).isoformat(), 'gate': row.gate}))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def movement_report_pdf(rows, subtitle):
+    # One page per `per_page` rows, each sent as soon as it is laid out
+    pdf = PDFStream(title='Vehicle Entry/Exit Report')
+    yield pdf.begin()
+    width, height = A4
+    margin, row_height = 40, 14
+    columns = ((margin, 'Date/Time (EAT)'), (190, 'Plate'), (300, 'Action'), (380, 'Gate'))
+    per_page = int((height - 2 * margin - 60) // row_height)
+    page_no = 0
+    while True:
+        chunk = list(itertools.islice(rows, per_page))
+        if not chunk and page_no:
+            break
+        page_no += 1
+        page = Page()
+        page.text(margin, height - margin, 'Vehicle Entry/Exit Report', 14, bold=True)
+        page.text(margin, height - margin - 16, subtitle, 9)
+        y = height - margin - 44
+        page.box(margin, y - 4, width - 2 * margin, row_height, gray=0.85)
+        for x, label in columns:
+            page.text(x + 4, y, label, 9, bold=True)
+        for row in chunk:
+            y -= row_height
+            values = (to_nairobi(row.timestamp).strftime('%Y-%m-%d %H:%M:%S'), row.plate,
+                      row.action.capitalize(), row.gate or '')
+            for (x, _), value in zip(columns, values):
+                page.text(x + 4, y, value, 9)
+            page.line(margin, y - 4, width - margin, y - 4, width=0.25)
+        if not chunk:
+            page.text(margin + 4, y - row_height, 'No movements match these filters.', 10)
+        page.text(width - margin - 40, margin / 2, f"Page {page_no}", 8)
+        yield pdf.add_page(page)
+        if len(chunk) < per_page:
+            break
+    yield pdf.end()
+
+def qr_sheet_pdf(vehicles, columns=3, rows_per_page=4):
+    # Printable sheet of QR codes, 12 per A4 page, to cut out and stick on
+    # windscreens. Images come from the QR cache.
+    pdf = PDFStream(title='Vehicle QR Codes')
+    yield pdf.begin()
+    width, height = A4
+    margin = 30
+    cell_w = (width - 2 * margin) / columns
+    cell_h = (height - 2 * margin) / rows_per_page
+    size = min(cell_w, cell_h) - 50
+    per_page = columns * rows_per_page
+    page_no = 0
+    while True:
+        chunk = list(itertools.islice(vehicles, per_page))
+        if not chunk and page_no:
+            break
+        page_no += 1
+        page = Page()
+        for i, vehicle in enumerate(chunk):
+            x = margin + (i % columns) * cell_w
+            top = height - margin - (i // columns) * cell_h
+            page.rect(x, top - cell_h, cell_w, cell_h, width=0.25)
+            _, png = qr_cache.get(qr_scan_url(vehicle))
+            page.image(png, x + (cell_w - size) / 2, top - size - 8, size, size)
+            page.text(x + 10, top - size - 24, vehicle.plate, 13, bold=True)
+            page.text(x + 10, top - size - 36, f"{vehicle.owner} ({vehicle.pj_number})"[:42], 8)
+        if not chunk:
+            page.text(margin, height - margin - 20, 'No vehicles selected.', 10)
+        yield pdf.add_page(page)
+        if len(chunk) < per_page:
+            break
+    yield pdf.end()
+
+@app.route('/reports/movements.pdf')
+@reads_snapshot
+def movement_report():
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    try:
+        filters = movement_filters(request.args)
+    except ValueError:
+        return "Invalid filter", 400
+    described = [f"{k.replace('_', ' ')}: {request.args[k]}" for k in ('plate', 'action', 'date_from', 'date_to')
+                 if request.args.get(k)]
+    generated = to_nairobi(datetime.datetime.utcnow()).strftime('%Y-%m-%d %H:%M')
+    subtitle = f"Generated {generated} EAT" + (f" - {', '.join(described)}" if described else '')
+    as_of = data_as_of()
+    if as_of is not None:
+        subtitle += f" - data as of {to_nairobi(as_of[0]).strftime('%H:%M')}"
+    rows = iter(iter_movements(filters, app.config['EXPORT_CHUNK_SIZE']))
+    return Response(stream_with_context(movement_report_pdf(rows, subtitle)), mimetype='application/pdf',
+                    headers={'Content-Disposition': 'attachment; filename=vehicle_movements.pdf'})
+
+@app.route('/reports/qr-sheet.pdf')
+def qr_sheet():
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    query = db.session.query(Registration.id, Registration.plate, Registration.owner, Registration.pj_number,
+                             Registration.timestamp)
+    if request.args.get('ids'):
+        try:
+            ids = [int(i) for i in request.args['ids'].split(',')]
+        except ValueError:
+            return "ids must be a comma separated list of numbers", 400
+        query = query.filter(Registration.id.in_(ids))
+    if request.args.get('institution'):
+        query = query.filter(Registration.institution == request.args['institution'])
+    vehicles = iter(query.order_by(Registration.plate).yield_per(app.config['EXPORT_CHUNK_SIZE']))
+    return Response(stream_with_context(qr_sheet_pdf(vehicles)),
+                    mimetype='application/pdf', headers={'Content-Disposition': 'attachment; filename=vehicle_qr_codes.pdf'})
+
+def search_vehicles(q, limit):
+    match = registration_match(q)
+    if match:
+        return db.session.execute(db.text(
+            "SELECT r.id, r.plate, r.pj_number, r.owner, r.institution FROM registration_fts "
+            "JOIN registration r ON r.id = registration_fts.rowid "
+            "WHERE registration_fts MATCH :match ORDER BY rank LIMIT :limit"),
+            {'match': match, 'limit': limit}).all()
+    # Too short for the trigram index: plate prefix
+    return (db.session.query(Registration.id, Registration.plate, Registration.pj_number,
+                             Registration.owner, Registration.institution)
+            .filter(Registration.plate.startswith(compact(q), autoescape=True))
+            .order_by(Registration.plate).limit(limit).all())
+
+def search_plates(q, limit):
+    # Plates seen at a gate, registered or not, with their last scan
+    match = plate_match(q)
+    if match:
+        return db.session.execute(db.text(
+            "SELECT p.plate, p.last_action, p.last_timestamp, p.gate FROM presence_fts "
+            "JOIN presence p ON p.rowid = presence_fts.rowid "
+            "WHERE presence_fts MATCH :match ORDER BY rank LIMIT :limit")
+            .columns(Presence.plate, Presence.last_action, Presence.last_timestamp, Presence.gate),
+            {'match': match, 'limit': limit}).all()
+    return (db.session.query(Presence.plate, Presence.last_action, Presence.last_timestamp, Presence.gate)
+            .filter(Presence.plate.startswith(compact(q), autoescape=True))
+            .order_by(Presence.plate).limit(limit).all())
+
+@app.route('/search')
+def search():
+    if 'admin' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    q = (request.args.get('q') or '').strip()
+    limit = max(1, min(request.args.get('limit', app.config['SEARCH_LIMIT'], type=int), 100))
+    if not compact(q):
+        return jsonify({'query': q, 'vehicles': [], 'plates': []})
+    vehicles = [{'id': r.id, 'plate': r.plate, 'pj_number': r.pj_number, 'owner': r.owner,
+                 'institution': r.institution} for r in search_vehicles(q, limit)]
+    plates = [{'plate': r.plate, 'last_action': r.last_action, 'gate': r.gate,
+               'last_seen': to_nairobi(r.last_timestamp).strftime('%Y-%m-%d %H:%M:%S')}
+              for r in search_plates(q, limit)]
+    return jsonify({'query': q, 'vehicles': vehicles, 'plates': plates})
+
+@app.route('/export_movements')
+@reads_snapshot
+def export_movements():
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return "Unsupported export format", 400
+    try:
+        filters = movement_filters(request.args)
+    except ValueError:
+        return "Invalid filter", 400
+    chunk_size = app.config['EXPORT_CHUNK_SIZE']
+    rows = iter_movements(filters, chunk_size)
+    if fmt == 'csv':
+        body, mimetype = export_csv(rows, chunk_size), 'text/csv'
+    else:
+        body, mimetype = export_ndjson(rows, chunk_size), 'application/x-ndjson'
+    filename = f"vehicle_movements.{fmt}"
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 @app.route('/')
 def root():
     return redirect(url_for('admin_login'))
 
+@app.route('/occupancy')
+@reads_snapshot
+def occupancy():
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    vehicles = [{'plate': p.plate, 'since': to_nairobi(p.last_timestamp).isoformat(), 'gate': p.gate}
+                for p in vehicles_on_site()]
+    return jsonify({'count': len(vehicles), 'vehicles': vehicles})
+
+rollup_lock = threading.Lock()
+
+def refresh_rollups(chunk_size=5000):
+    # Fold movements newer than the 'rollups' watermark into TrafficRollup;
+    # cost is proportional to the new rows only
+    with rollup_lock:
+        mark = db.session.get(Watermark, 'rollups') or Watermark(name='rollups', last_id=0)
+        start = mark.last_id
+        institution = (db.select(Registration.institution).where(Registration.plate == Movement.plate)
+                       .limit(1).scalar_subquery())
+        rows = (db.session.query(Movement.id, Movement.action, Movement.timestamp, institution.label('institution'))
+                .filter(Movement.id > start, Movement.timestamp.isnot(None)).order_by(Movement.id).yield_per(chunk_size))
+        counts = {}
+        last_id = start
+        for row in rows:
+            bucket = to_nairobi(row.timestamp).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+            key = (bucket, row.institution or 'Unknown', row.action)
+            counts[key] = counts.get(key, 0) + 1
+            last_id = row.id
+        if last_id == start:
+            return 0
+        stmt = sqlite_insert(TrafficRollup)
+        stmt = stmt.on_conflict_do_update(index_elements=[TrafficRollup.bucket, TrafficRollup.institution, TrafficRollup.action],
+                                          set_={'count': TrafficRollup.count + stmt.excluded.count})
+        db.session.execute(stmt, [{'bucket': b, 'institution': i, 'action': a, 'count': c} for (b, i, a), c in counts.items()])
+        mark.last_id = last_id
+        db.session.merge(mark)
+        db.session.commit()
+        return sum(counts.values())
+
+@app.route('/analytics/traffic')
+def traffic_analytics():
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in ('hour', 'day'):
+        return jsonify({'error': 'granularity must be hour or day'}), 400
+    refresh_rollups()
+    if granularity == 'hour':
+        bucket = TrafficRollup.bucket
+    else:
+        bucket = db.func.date(TrafficRollup.bucket)
+    query = db.session.query(bucket.label('bucket'), TrafficRollup.institution, TrafficRollup.action,
+                             db.func.sum(TrafficRollup.count).label('count'))
+    try:
+        # Buckets are already Nairobi-local, so dates compare directly
+        if request.args.get('date_from'):
+            query = query.filter(TrafficRollup.bucket >= datetime.datetime.strptime(request.args['date_from'], '%Y-%m-%d'))
+        if request.args.get('date_to'):
+            end = datetime.datetime.strptime(request.args['date_to'], '%Y-%m-%d') + datetime.timedelta(days=1)
+            query = query.filter(TrafficRollup.bucket < end)
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    if request.args.get('institution'):
+        query = query.filter(TrafficRollup.institution == request.args['institution'])
+    rows = query.group_by(bucket, TrafficRollup.institution, TrafficRollup.action).order_by(bucket).all()
+    series = {}
+    for row in rows:
+        label = row.bucket if isinstance(row.bucket, str) else row.bucket.isoformat()
+        point = series.setdefault((label, row.institution), {'bucket': label, 'institution': row.institution,
+                                                             'entry': 0, 'exit': 0})
+        point[row.action] = row.count
+    return jsonify({'granularity': granularity, 'series': list(series.values())})
+
+def dwell_stats(group, percentile, filters, limit):
+    # One pass over Visit: window functions rank closed visits by duration
+    # within each group, so the nearest-rank percentile comes out of the
+    # same grouped query as the average and the longest stay
+    key = {'plate': Visit.plate, 'institution': Visit.institution, 'day': Visit.day}[group]
+    ranked = (db.select(key.label('key'), Visit.status, Visit.duration_seconds,
+                        db.func.row_number().over(partition_by=(key, Visit.status),
+                                                  order_by=Visit.duration_seconds).label('rank'),
+                        db.func.count().over(partition_by=(key, Visit.status)).label('n'))
+              .where(*filters).subquery())
+    closed = ranked.c.status == 'closed'
+    at_percentile = closed & (ranked.c.rank == (ranked.c.n * percentile + 99) // 100)
+    visits = db.func.count(db.case((closed, 1))).label('visits')
+    query = db.select(
+        ranked.c.key, visits,
+        db.func.avg(db.case((closed, ranked.c.duration_seconds))).label('avg'),
+        db.func.max(db.case((at_percentile, ranked.c.duration_seconds))).label('percentile'),
+        db.func.max(db.case((closed, ranked.c.duration_seconds))).label('longest'),
+        *[db.func.count(db.case((ranked.c.status == status, 1))).label(status)
+          for status in ('open', 'missing_exit', 'orphan_exit')]
+    ).group_by(ranked.c.key)
+    query = query.order_by(ranked.c.key) if group == 'day' else query.order_by(visits.desc(), ranked.c.key)
+    return db.session.execute(query.limit(limit)).all()
+
+@app.route('/analytics/dwell')
+def dwell_analytics():
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    group = request.args.get('group', 'plate')
+    if group not in ('plate', 'institution', 'day'):
+        return jsonify({'error': 'group must be plate, institution or day'}), 400
+    percentile = request.args.get('p', 95, type=int)
+    if not 1 <= percentile <= 100:
+        return jsonify({'error': 'p must be between 1 and 100'}), 400
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    filters = []
+    try:
+        # Visit.day is the Nairobi-local date the visit started
+        if request.args.get('date_from'):
+            filters.append(Visit.day >= datetime.datetime.strptime(request.args['date_from'], '%Y-%m-%d').date())
+        if request.args.get('date_to'):
+            filters.append(Visit.day <= datetime.datetime.strptime(request.args['date_to'], '%Y-%m-%d').date())
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    if request.args.get('plate'):
+        filters.append(Visit.plate == request.args['plate'].strip().upper())
+    if request.args.get('institution'):
+        filters.append(Visit.institution == request.args['institution'])
+    fill_visit_institutions()
+
+    def minutes(seconds):
+        return None if seconds is None else round(seconds / 60, 1)
+    groups = [{group: row.key if isinstance(row.key, str) else row.key.isoformat(),
+               'visits': row.visits, 'avg_minutes': minutes(row.avg),
+               f'p{percentile}_minutes': minutes(row.percentile), 'longest_minutes': minutes(row.longest),
+               'open': row.open, 'missing_exit': row.missing_exit, 'orphan_exit': row.orphan_exit}
+              for row in dwell_stats(group, percentile, filters, limit)]
+    return jsonify({'group': group, 'percentile': percentile, 'groups': groups})
+
+alert_lock = threading.Lock()
+alerts_raised = Counter('alerts_raised_total', 'Alerts raised, by rule.', ['rule'])
+
+def raise_alert(rule, plate, dedup_key, message, now):
+    # Returns 1 for a new alert, 0 if this event already raised one
+    stmt = sqlite_insert(Alert).values(
+        rule=rule, plate=plate, dedup_key=dedup_key, message=message[:255], created_at=now,
+        webhook_status='pending' if app.config['ALERT_WEBHOOK_URL'] else None, next_attempt_at=now)
+    if db.session.execute(stmt.on_conflict_do_nothing(index_elements=['dedup_key'])).rowcount:
+        alerts_raised.inc(rule=rule)
+        return 1
+    return 0
+
+def overstay_alert(presence, now):
+    gate = f" at gate {presence.gate}" if presence.gate else ''
+    message = (f"{presence.plate} entered{gate} at {to_nairobi(presence.last_timestamp):%Y-%m-%d %H:%M} EAT "
+               f"and has not left after {app.config['OVERSTAY_HOURS']:g} h")
+    return raise_alert('overstay', presence.plate, f"overstay:{presence.plate}:{presence.last_timestamp.isoformat()}",
+                       message, now)
+
+def check_overstays(now, chunk_size=500):
+    # A vehicle overstays when its last scan is an entry older than the
+    # limit. Each pass reads only the entries that crossed the limit since
+    # the previous pass, plus plates with movements recorded since then (a
+    # late upload can leave an old entry as the last scan), so the cost
+    # follows new events rather than the number of vehicles inside.
+    if not app.config['OVERSTAY_HOURS']:
+        return 0
+    cutoff = now - datetime.timedelta(hours=app.config['OVERSTAY_HOURS'])
+    mark = db.session.get(Watermark, 'alerts_overstay') or Watermark(name='alerts_overstay', last_id=0)
+    since = mark.last_timestamp
+    max_id = db.session.query(db.func.max(Movement.id)).scalar() or 0
+    raised = 0
+    query = Presence.query.filter(Presence.last_action == 'entry', Presence.last_timestamp <= cutoff)
+    if since is not None:
+        query = query.filter(Presence.last_timestamp > since)
+    for presence in query.order_by(Presence.last_timestamp):
+        raised += overstay_alert(presence, now)
+    if since is not None:
+        plates = [p for (p,) in db.session.query(Movement.plate).distinct()
+                  .filter(Movement.id > mark.last_id, Movement.id <= max_id)]
+        for start in range(0, len(plates), chunk_size):
+            late = Presence.query.filter(Presence.plate.in_(plates[start:start + chunk_size]),
+                                         Presence.last_action == 'entry', Presence.last_timestamp <= since)
+            for presence in late:
+                raised += overstay_alert(presence, now)
+    mark.last_id = max_id
+    mark.last_timestamp = cutoff
+    db.session.merge(mark)
+    return raised
+
+def check_rejections(now, chunk_size=1000):
+    # Every new rejected scan counts the rejections of its plate in the
+    # window before it (one indexed count each); reaching the threshold
+    # raises one alert for the burst
+    threshold, window = app.config['REJECTION_ALERT_COUNT'], app.config['REJECTION_ALERT_WINDOW']
+    mark = db.session.get(Watermark, 'alerts_rejections') or Watermark(name='alerts_rejections', last_id=0)
+    raised = 0
+    while threshold:
+        rows = (db.session.query(RejectedScan.id, RejectedScan.plate, RejectedScan.reason, RejectedScan.timestamp)
+                .filter(RejectedScan.id > mark.last_id).order_by(RejectedScan.id).limit(chunk_size).all())
+        if not rows:
+            break
+        for row in rows:
+            count = (db.session.query(db.func.count(RejectedScan.id))
+                     .filter(RejectedScan.plate == row.plate, RejectedScan.id <= row.id,
+                             RejectedScan.timestamp > row.timestamp - datetime.timedelta(seconds=window),
+                             RejectedScan.timestamp <= row.timestamp).scalar())
+            if count == threshold:
+                reason = 'not registered' if row.reason == 'not_registered' else 'with an invalid QR code'
+                span = f"{window // 60} min" if window % 60 == 0 else f"{window} s"
+                message = f"{row.plate} was refused {count} times within {span} ({reason})"
+                raised += raise_alert('repeated_rejection', row.plate, f"rejected:{row.plate}:{row.id}", message, now)
+        mark.last_id = rows[-1].id
+    db.session.merge(mark)
+    # Only rows the rules are done with are pruned
+    retention = now - datetime.timedelta(days=app.config['REJECTED_SCAN_RETENTION_DAYS'])
+    db.session.execute(db.delete(RejectedScan).where(RejectedScan.timestamp < retention, RejectedScan.id <= mark.last_id))
+    return raised
+
+def evaluate_alerts(now=None):
+    now = now or datetime.datetime.utcnow()
+    with alert_lock:
+        raised = check_overstays(now) + check_rejections(now)
+        db.session.commit()
+        return raised
+
+def deliver_alert_webhooks(limit=50):
+    # One pass over due webhook calls, retried with backoff like the outbox
+    url = app.config['ALERT_WEBHOOK_URL']
+    if not url:
+        return 0
+    now = datetime.datetime.utcnow()
+    due = (Alert.query.filter(Alert.webhook_status == 'pending', Alert.next_attempt_at <= now)
+           .order_by(Alert.id).limit(limit).all())
+    for alert in due:
+        payload = {'id': alert.id, 'rule': alert.rule, 'plate': alert.plate, 'message': alert.message,
+                   'created_at': alert.created_at.isoformat() + 'Z'}
+        try:
+            post_json(url, payload, app.config['ALERT_WEBHOOK_SECRET'])
+            alert.webhook_status = 'sent'
+        except Exception as e:
+            alert.webhook_attempts += 1
+            alert.last_error = str(e)[:255]
+            if alert.webhook_attempts >= app.config['ALERT_WEBHOOK_MAX_ATTEMPTS']:
+                alert.webhook_status = 'failed'
+                app.logger.error('Giving up on webhook for alert %s: %s', alert.id, e)
+            else:
+                alert.next_attempt_at = now + datetime.timedelta(
+                    seconds=backoff(alert.webhook_attempts, app.config['ALERT_WEBHOOK_RETRY_BASE']))
+        db.session.commit()
+    return len(due)
+
+@app.route('/alerts')
+def alerts_inbox():
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    show_all = request.args.get('show') == 'all'
+    query = Alert.query
+    if not show_all:
+        query = query.filter(Alert.acknowledged_at.is_(None))
+    alerts = query.order_by(Alert.created_at.desc(), Alert.id.desc()).limit(200).all()
+    return render_template('alerts.html', alerts=alerts, show_all=show_all)
+
+@app.route('/alerts/<int:id>/ack', methods=['POST'])
+def acknowledge_alert(id):
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    alert = db.get_or_404(Alert, id)
+    if alert.acknowledged_at is None:
+        alert.acknowledged_at = datetime.datetime.utcnow()
+        alert.acknowledged_by = session['admin']
+        db.session.commit()
+    return redirect(url_for('alerts_inbox', show=request.args.get('show')))
+
+def archive_movements(cutoff, chunk_size=None, pause=0.0):
+    # Move movements older than cutoff into the monthly archive files, one
+    # short transaction per chunk so gate writes keep getting through
+    chunk_size = chunk_size or app.config['PURGE_CHUNK_SIZE']
+    directory = app.config['ARCHIVE_DIR']
+    columns = [c.name for c in Movement.__table__.columns]
+    archived = {}
+    while True:
+        rows = (db.session.query(*Movement.__table__.columns).filter(Movement.timestamp < cutoff)
+                .order_by(Movement.id).limit(chunk_size).all())
+        if not rows:
+            break
+        months = {}
+        for row in rows:
+            months.setdefault(to_nairobi(row.timestamp).strftime('%Y-%m'), []).append(dict(zip(columns, row)))
+        for month, records in months.items():
+            retention.append_records(directory, month, records)
+            archived[month] = archived.get(month, 0) + len(records)
+        db.session.execute(db.delete(Movement).where(Movement.id.in_([row.id for row in rows])))
+        db.session.commit()
+        if pause:
+            time.sleep(pause)
+    return archived
+
+def restore_archived_month(month, chunk_size=None):
+    # Put an archived month back into Movement; rows still present are
+    # skipped. Visits outlive archiving, so they are already paired.
+    chunk_size = chunk_size or app.config['PURGE_CHUNK_SIZE']
+    restored = 0
+    records = retention.read_records(app.config['ARCHIVE_DIR'], month)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+        result = db.session.execute(sqlite_insert(Movement.__table__).on_conflict_do_nothing(), chunk)
+        restored += result.rowcount
+        db.session.commit()
+    return restored
+
+@app.route('/archive')
+def list_archives():
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    return jsonify({'months': retention.list_months(app.config['ARCHIVE_DIR'])})
+
+@app.route('/archive/<month>')
+def query_archive(month):
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    plate = (request.args.get('plate') or '').strip().upper()
+    try:
+        records = retention.read_records(app.config['ARCHIVE_DIR'], month)
+        first = next(records, None)
+    except (ValueError, FileNotFoundError):
+        return jsonify({'error': f'No archive for {month}'}), 404
+
+    def body():
+        for record in itertools.chain([first] if first else [], records):
+            if not plate or record['plate'] == plate:
+                record['timestamp'] = to_nairobi(record['timestamp']).isoformat()
+                yield json.dumps(record) + '\n'
+    return Response(body(), mimetype='application/x-ndjson')
+
+@app.route('/archive/<month>/restore', methods=['POST'])
+def restore_archive(month):
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    try:
+        restored = restore_archived_month(month)
+    except (ValueError, FileNotFoundError):
+        return jsonify({'error': f'No archive for {month}'}), 404
+    return jsonify({'success': True, 'month': month, 'restored': restored})
+
+@app.route('/admin/cache-stats')
+def cache_stats():
+    if 'admin' not in session:
+        return redirect('/admin-login')
+    return jsonify({'devices': device_cache.stats(), 'plates': plate_cache.stats(),
+                    'ingest': movement_writer.stats(), 'qr': qr_cache.stats(),
+                    'live_logs': movement_hub.stats()})
+
+cache_hits = Gauge('cache_hits', 'Cache hits since start.', ['cache'])
+cache_misses = Gauge('cache_misses', 'Cache misses since start.', ['cache'])
+cache_size = Gauge('cache_entries', 'Entries currently cached.', ['cache'])
+ingest_pending = Gauge('ingest_queue_pending', 'Scans waiting for the batch writer.')
+ingest_failed = Gauge('ingest_rows_failed', 'Scans the batch writer gave up on.')
+live_log_viewers = Gauge('live_log_viewers', 'Open /view-logs/stream connections.')
+reporting_snapshot_age = Gauge('reporting_snapshot_age_seconds', 'Age of the reporting copy of the database.')
+
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if not (token and secrets.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")) \
+            and 'admin' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    for name, stats in (('devices', device_cache.stats()), ('plates', plate_cache.stats()), ('qr', qr_cache.stats())):
+        cache_hits.set(stats['hits'], cache=name)
+        cache_misses.set(stats['misses'], cache=name)
+        cache_size.set(stats['size'], cache=name)
+    ingest = movement_writer.stats()
+    ingest_pending.set(ingest['pending'])
+    ingest_failed.set(ingest['failed'])
+    live_log_viewers.set(movement_hub.stats()['subscribers'])
+    age = snapshot.age_seconds(app.config['REPORTING_DB'])
+    if app.config['REPORTING_MODE'] == 'snapshot' and age is not None:
+        reporting_snapshot_age.set(round(age, 1))
+    return Response(render_all(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/debug-base-url')
 def debug_base_url():
     base_url = os.getenv('BASE_URL')
@@ -304,19 +2191,48 @@ def clear_logs():
     if not request.is_json:
         return jsonify({'success': False, 'message': 'Invalid request.'}), 400
     data = request.get_json()
-    password = data.get('password', '')
-    admin = Admin.query.filter_by(username='admin').first()
-    if not admin or not admin.check_password(password):
-        return jsonify({'success': False, 'message': 'Incorrect admin password.'}), 403
+    if not is_elevated():
+        password = data.get('password', '')
+        admin = Admin.query.filter_by(username='admin').first()
+        if not admin or not admin.check_password(password):
+            return jsonify({'success': False, 'message': 'Incorrect admin password.'}), 403
+        if session.get('admin') == admin.username:
+            elevate_session()
     try:
-        num_deleted = Movement.query.delete()
+        # History is archived, not thrown away, and deleted in small chunks
+        archived = archive_movements(datetime.datetime.utcnow() + datetime.timedelta(seconds=1))
+        Presence.query.delete()
         db.session.commit()
-        return jsonify({'success': True, 'message': f'Logs cleared ({num_deleted} entries deleted).'})
+        plate_state.clear()
+        num_deleted = sum(archived.values())
+        return jsonify({'success': True, 'message': f'Logs archived and cleared ({num_deleted} entries).'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': 'Error clearing logs.'}), 500
 
-if __name__ == '__main__':
+def create_app(workers=True):
+    # Entry point for anything that serves requests (wsgi.py, python app.py,
+    # the EXE). Importing app only defines it; this migrates the database
+    # and starts the background workers: mail, which delivers mail left in
+    # the outbox by a previous run, the alert rules, and in snapshot
+    # reporting mode the reporting copy refresher.
+    if code_signer is None:
+        raise RuntimeError(NO_SIGNING_KEY)
     with app.app_context():
-        db.create_all()
-    app.run(host='0.0.0.0', debug=True)
+        upgrade_database()
+    if workers:
+        start_mail_worker()
+        start_alert_worker()
+        if app.config['REPORTING_MODE'] == 'snapshot':
+            start_snapshot_worker()
+    return app
+
+if __name__ == '__main__':
+    # Needed for the QR render pool inside the PyInstaller EXE
+    multiprocessing.freeze_support()
+    # The reloader runs the app a second time in a child process; for the
+    # onefile EXE that means unpacking and importing everything twice
+    use_reloader = not getattr(sys, 'frozen', False)
+    # With the reloader only its child serves requests; run the workers there
+    create_app(workers=not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
+    app.run(host='0.0.0.0', debug=True, use_reloader=use_reloader)
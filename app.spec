@@ -9,7 +9,8 @@ a = Analysis(
     datas=[
         ('static', 'static'),
         ('templates', 'templates'),
-        ('car_system.db', '.')
+        ('car_system.db', '.'),
+        ('migrations', 'migrations')
     ],
     hiddenimports=[
         'flask',
@@ -27,11 +28,18 @@ a = Analysis(
         'email.mime.multipart',
         'smtplib',
         'uuid',
-        'datetime'
+        'datetime',
+        'flask_migrate',
+        'alembic',
+        'alembic.ddl.sqlite',
+        'logging.config',
+        'openpyxl'
     ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
+    # create_app() migrates outdated databases, so alembic and migrations/
+    # must stay in the bundle
     excludes=[],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
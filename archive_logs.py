@@ -0,0 +1,18 @@
+import datetime
+from app import app, archive_movements
+
+def archive_logs(days):
+    with app.app_context():
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+        archived = archive_movements(cutoff, pause=0.05)
+        if not archived:
+            print(f"No movements older than {days} days.")
+        for month, count in sorted(archived.items()):
+            print(f"{month}: {count} movements archived to {app.config['ARCHIVE_DIR']}.")
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 2:
+        print("Usage: python archive_logs.py [retention_days]")
+    else:
+        archive_logs(int(sys.argv[1]) if len(sys.argv) == 2 else app.config['RETENTION_DAYS'])
@@ -0,0 +1,50 @@
+import os, sys, tempfile, threading, time
+
+# Compare per-request commits with the batched writer on a throwaway database
+db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+# Every scan must be stored, so nothing may be dropped as a double tap
+os.environ['SCAN_DEBOUNCE_SECONDS'] = '0'
+
+from app import app, db, AuthorizedDevice, Registration, Movement, Presence, movement_writer, plate_state
+
+def run(mode, threads, scans_per_thread):
+    app.config['INGEST_MODE'] = mode
+    with app.app_context():
+        Movement.query.delete()
+        Presence.query.delete()
+        db.session.commit()
+    plate_state.clear()
+
+    def gate(plate):
+        # One plate per gate thread, so each vehicle alternates cleanly
+        client = app.test_client()
+        for i in range(scans_per_thread):
+            client.get(f"/track/{plate}/{'entry' if i % 2 == 0 else 'exit'}?token=bench-token")
+
+    workers = [threading.Thread(target=gate, args=(f'KBENCH{n}',)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    movement_writer.flush()
+    elapsed = time.perf_counter() - start
+    with app.app_context():
+        count = Movement.query.count()
+    return count, elapsed
+
+if __name__ == '__main__':
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    scans = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+    with app.app_context():
+        db.create_all()
+        db.session.add(AuthorizedDevice(mac_address='00:00:00:00:00:00', token='bench-token'))
+        for n in range(threads):
+            db.session.add(Registration(pj_number=f'PJBENCH{n}', plate=f'KBENCH{n}', owner='Bench', institution='Bench'))
+        db.session.commit()
+    for mode in ('sync', 'batched'):
+        count, elapsed = run(mode, threads, scans)
+        assert count == threads * scans, f"{mode}: stored {count} of {threads * scans} scans"
+        print(f"{mode:8} {count} scans in {elapsed:.2f}s -> {count / elapsed:.0f} scans/s")
+    movement_writer.stop()
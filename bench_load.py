@@ -0,0 +1,187 @@
+import os, sys, json, time, random, logging, argparse, datetime, tempfile, threading, subprocess
+import urllib.request, urllib.parse, urllib.error, http.cookiejar
+
+# Load test against a seeded throwaway database served by waitress, e.g.
+#   python bench_load.py --registrations 2000 --movements 10000,100000 --gates 8 --readers 2
+# Results are written as JSON so runs can be compared with --compare.
+db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_file}'
+
+import jinja2
+from waitress.server import create_server
+from app import app, db, Admin, AuthorizedDevice, Registration, Movement, rebuild_presence, movement_writer
+
+# Templates live next to app.py in this repo
+app.jinja_loader = jinja2.FileSystemLoader(os.path.dirname(os.path.abspath(__file__)))
+
+# waitress warns on every queued request once the load exceeds its threads
+logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+
+TOKEN = 'bench-token'
+ADMIN_USER, ADMIN_PASSWORD = 'bench', 'bench-password'
+
+def plate_for(i):
+    return f"KB{i:05d}"
+
+def seed(registrations, movements, chunk_size=5000):
+    # Movements alternate entry/exit per plate and are spread over 90 days
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username=ADMIN_USER)
+        admin.set_password(ADMIN_PASSWORD)
+        db.session.add(admin)
+        db.session.add(AuthorizedDevice(mac_address='00:00:00:00:00:00', token=TOKEN))
+        db.session.execute(db.insert(Registration), [
+            {'pj_number': f"PJB{i:05d}", 'plate': plate_for(i), 'owner': f"Driver {i}",
+             'institution': f"Court {i % 20}"} for i in range(registrations)])
+        start = datetime.datetime.utcnow() - datetime.timedelta(days=90)
+        step = datetime.timedelta(days=90) / max(movements, 1)
+        batch = []
+        for i in range(movements):
+            batch.append({'plate': plate_for(i % registrations), 'timestamp': start + step * i,
+                          'action': 'entry' if (i // registrations) % 2 == 0 else 'exit'})
+            if len(batch) >= chunk_size:
+                db.session.execute(db.insert(Movement), batch)
+                batch = []
+        if batch:
+            db.session.execute(db.insert(Movement), batch)
+        db.session.commit()
+        rebuild_presence()
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+def summarize(samples, elapsed):
+    routes = {}
+    for route, latencies in sorted(samples.items()):
+        ok = sorted(t for t, status in latencies if status < 400)
+        routes[route] = {
+            'requests': len(latencies),
+            'errors': len(latencies) - len(ok),
+            'throughput': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(ok, 50) * 1000, 2) if ok else None,
+            'p95_ms': round(percentile(ok, 95) * 1000, 2) if ok else None,
+            'p99_ms': round(percentile(ok, 99) * 1000, 2) if ok else None,
+        }
+    return routes
+
+def fetch(opener, url, data=None):
+    start = time.perf_counter()
+    try:
+        with opener.open(url, data=data, timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 599
+    return time.perf_counter() - start, status
+
+def run_load(base_url, registrations, gates, readers, duration):
+    samples = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def record(route, sample):
+        with lock:
+            samples.setdefault(route, []).append(sample)
+
+    def gate(seed):
+        rng = random.Random(seed)
+        opener = urllib.request.build_opener()
+        while not stop.is_set():
+            plate = plate_for(rng.randrange(registrations))
+            action = rng.choice(('entry', 'exit'))
+            record('track', fetch(opener, f"{base_url}/track/{plate}/{action}?token={TOKEN}&gate=bench-{seed}"))
+
+    def reader(seed):
+        rng = random.Random(seed)
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        fetch(opener, f"{base_url}/admin-login",
+              urllib.parse.urlencode({'username': ADMIN_USER, 'password': ADMIN_PASSWORD}).encode())
+        routes = [
+            ('view_logs', lambda: '/view-logs'),
+            ('view_logs_plate', lambda: f"/view-logs?plate={plate_for(rng.randrange(registrations))}"),
+            ('view_vehicles', lambda: '/view-vehicles'),
+            ('occupancy', lambda: '/occupancy'),
+            ('analytics_traffic', lambda: '/analytics/traffic?granularity=day'),
+        ]
+        while not stop.is_set():
+            route, path = rng.choice(routes)
+            record(route, fetch(opener, base_url + path()))
+
+    workers = [threading.Thread(target=gate, args=(i,)) for i in range(gates)]
+    workers += [threading.Thread(target=reader, args=(1000 + i,)) for i in range(readers)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    time.sleep(duration)
+    stop.set()
+    for w in workers:
+        w.join()
+    movement_writer.flush()
+    return summarize(samples, time.perf_counter() - start)
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def print_results(run, previous=None):
+    print(f"\n{run['movements']} movements, {run['registrations']} registrations:")
+    print(f"{'route':20} {'req':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, r in run['routes'].items():
+        line = (f"{route:20} {r['requests']:>7} {r['errors']:>5} {r['throughput']:>8} "
+                f"{r['p50_ms'] or '-':>8} {r['p95_ms'] or '-':>8} {r['p99_ms'] or '-':>8}")
+        old = (previous or {}).get('routes', {}).get(route)
+        if old and old['throughput']:
+            line += f"   {(r['throughput'] - old['throughput']) / old['throughput']:+.0%} req/s"
+            if old['p95_ms'] and r['p95_ms']:
+                line += f", {(r['p95_ms'] - old['p95_ms']) / old['p95_ms']:+.0%} p95"
+        print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the gate scan path and admin pages.')
+    parser.add_argument('--registrations', type=int, default=1000)
+    parser.add_argument('--movements', default='10000', help='comma separated table sizes to run in turn')
+    parser.add_argument('--gates', type=int, default=8, help='concurrent simulated gates')
+    parser.add_argument('--readers', type=int, default=2, help='concurrent admin readers')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per table size')
+    parser.add_argument('--threads', type=int, default=8, help='waitress worker threads')
+    parser.add_argument('--output', default=f"bench-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {run['movements']: run for run in json.load(f)['runs']}
+
+    server = create_server(app, host='127.0.0.1', port=0, threads=args.threads)
+    base_url = f"http://127.0.0.1:{server.effective_port}"
+    threading.Thread(target=server.run, daemon=True).start()
+
+    results = {'started': datetime.datetime.utcnow().isoformat() + 'Z', 'revision': git_revision(),
+               'python': sys.version.split()[0], 'ingest_mode': app.config['INGEST_MODE'],
+               'gates': args.gates, 'readers': args.readers, 'duration': args.duration,
+               'threads': args.threads, 'runs': []}
+    for movements in [int(m) for m in args.movements.split(',')]:
+        print(f"Seeding {args.registrations} registrations and {movements} movements...")
+        seed(args.registrations, movements)
+        run = {'registrations': args.registrations, 'movements': movements,
+               'routes': run_load(base_url, args.registrations, args.gates, args.readers, args.duration)}
+        results['runs'].append(run)
+        print_results(run, previous.get(movements))
+
+    server.close()
+    movement_writer.stop()
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
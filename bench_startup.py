@@ -0,0 +1,95 @@
+import os, sys, json, time, socket, argparse, datetime, statistics, subprocess, tempfile, urllib.request, urllib.error
+
+# Cold start: how long from launching a fresh interpreter until the app
+# answers its first request, and how long `import app` takes on its own.
+# Run before and after a change, e.g.
+#   python bench_startup.py --runs 10 --imports
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def child_env():
+    env = dict(os.environ)
+    env['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}"
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    env.setdefault('SECRET_KEY', 'bench-startup-secret')
+    return env
+
+def time_import():
+    code = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, '-c', code], cwd=HERE, env=child_env(),
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+def time_first_response(timeout=60):
+    # Serves wsgi.app with waitress, as in production
+    port = free_port()
+    code = f"import wsgi; from waitress import serve; serve(wsgi.app, host='127.0.0.1', port={port}, _quiet=True)"
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-c', code], cwd=HERE, env=child_env(),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1).read()
+                return time.perf_counter() - start
+            except urllib.error.HTTPError:
+                # Any HTTP answer means the app is serving
+                return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError('server did not answer within %ss' % timeout)
+    finally:
+        server.terminate()
+        server.wait()
+
+def slowest_imports(count):
+    # Cumulative time of each module imported directly by app.py, from
+    # python -X importtime (children are listed before their parent and
+    # indented two spaces per level)
+    err = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=HERE, env=child_env(),
+                         capture_output=True, text=True).stderr
+    children, top = [], []
+    for line in err.splitlines():
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(parts[1]), parts[2].strip()))
+        elif depth == 0:
+            if parts[2].strip() == 'app':
+                top = children
+            children = []
+    return sorted(top, reverse=True)[:count]
+
+def summary(samples):
+    return {'median_ms': round(statistics.median(samples) * 1000, 1),
+            'min_ms': round(min(samples) * 1000, 1), 'max_ms': round(max(samples) * 1000, 1)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure cold start time of the app.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--imports', action='store_true', help='also list the slowest imports')
+    parser.add_argument('--output', help='write results as JSON')
+    args = parser.parse_args()
+
+    results = {'started': datetime.datetime.utcnow().isoformat() + 'Z', 'python': sys.version.split()[0],
+               'runs': args.runs,
+               'import_app': summary([time_import() for _ in range(args.runs)]),
+               'first_response': summary([time_first_response() for _ in range(args.runs)])}
+    print(f"import app:     median {results['import_app']['median_ms']} ms "
+          f"(min {results['import_app']['min_ms']}, max {results['import_app']['max_ms']})")
+    print(f"first response: median {results['first_response']['median_ms']} ms "
+          f"(min {results['first_response']['min_ms']}, max {results['first_response']['max_ms']})")
+    if args.imports:
+        results['slowest_imports'] = [{'module': name, 'ms': round(us / 1000, 1)} for us, name in slowest_imports(15)]
+        print('\nslowest imports (cumulative):')
+        for row in results['slowest_imports']:
+            print(f"  {row['ms']:>8} ms  {row['module']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,57 @@
+import csv, io, threading, uuid
+
+# Columns match the fields of the dashboard registration form
+FIELDS = ('pj_number', 'plate', 'driver_name', 'phone_number', 'id_number')
+
+def normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+def read_rows(filename, stream):
+    # Yields (line number, {field: value}) for every non-empty data row
+    if filename.lower().endswith('.xlsx'):
+        rows = _xlsx_rows(stream)
+    else:
+        rows = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    header = [normalize_header(h) for h in next(rows, [])]
+    if 'pj_number' not in header:
+        raise ValueError('The file needs a header row with at least a pj_number column')
+    for line, values in enumerate(rows, 2):
+        values = ['' if v is None else str(v).strip() for v in values]
+        if any(values):
+            record = dict(zip(header, values))
+            yield line, {field: record.get(field, '') for field in FIELDS}
+
+def _xlsx_rows(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('XLSX import requires openpyxl; upload a CSV instead')
+    sheet = load_workbook(stream, read_only=True, data_only=True).active
+    return sheet.iter_rows(values_only=True)
+
+class ImportJob:
+    # Progress of the QR rendering that follows a bulk import
+
+    def __init__(self, report, total):
+        self.id = uuid.uuid4().hex
+        self.report = report
+        self.total = total
+        self.rendered = 0
+        self.failed = 0
+        self.status = 'rendering' if total else 'done'
+        self._lock = threading.Lock()
+
+    def advance(self, ok=True):
+        with self._lock:
+            if ok:
+                self.rendered += 1
+            else:
+                self.failed += 1
+
+    def finish(self):
+        self.status = 'done'
+
+    def progress(self):
+        with self._lock:
+            return {'job_id': self.id, 'status': self.status, 'total': self.total,
+                    'rendered': self.rendered, 'failed': self.failed}
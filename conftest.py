@@ -0,0 +1,58 @@
+import os, tempfile, jinja2, pytest
+
+# Keep the test run away from the real vehicle_log.db, QR cache and archive
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('QR_CACHE_DIR', tempfile.mkdtemp())
+os.environ.setdefault('ARCHIVE_DIR', tempfile.mkdtemp())
+os.environ.setdefault('QR_SIGNING_KEYS', 'test:test-signing-secret')
+
+from app import app, db, Admin, AuthorizedDevice, Registration
+
+# Templates sit next to app.py in this checkout
+app.jinja_loader = jinja2.FileSystemLoader(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(autouse=True)
+def fresh_database():
+    # Every test starts from empty tables, so scan-path caches, scan state
+    # and seen keys must not carry over either
+    from app import device_cache, plate_cache, plate_state, recent_keys, revocations, registration_plates
+    for cache in (device_cache, plate_cache, plate_state, recent_keys, revocations, registration_plates):
+        cache.clear()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+@pytest.fixture
+def gate_device():
+    with app.app_context():
+        db.session.add(AuthorizedDevice(mac_address='4C:66:A6:84:59:79', token='gate-token'))
+        db.session.commit()
+
+@pytest.fixture
+def gate(gate_device):
+    # A gate device and one registered vehicle, KAA987M
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ001', plate='KAA987M', owner='Test Driver', institution='0700000000'))
+        db.session.commit()
+
+@pytest.fixture
+def admin():
+    # Account 'admin' with password 'admin123'
+    with app.app_context():
+        account = Admin(username='admin')
+        account.set_password('admin123')
+        db.session.add(account)
+        db.session.commit()
+
+@pytest.fixture
+def admin_client():
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin'] = 'admin'
+    return client
+
+@pytest.fixture
+def no_debounce(monkeypatch):
+    # Scans recorded straight away, however close together
+    monkeypatch.setitem(app.config, 'SCAN_DEBOUNCE_SECONDS', 0)
+    monkeypatch.setitem(app.config, 'INGEST_MODE', 'sync')
@@ -0,0 +1,91 @@
+import logging, queue, threading, time
+
+logger = logging.getLogger(__name__)
+
+class BatchWriter:
+    # Write-behind queue: rows are handed to write_batch in groups of up to
+    # max_batch, at most max_delay seconds after the first row of a group
+    # arrived. The queue is bounded so a stalled database pushes back on
+    # callers instead of growing without limit.
+
+    def __init__(self, write_batch, max_batch=200, max_delay=0.05, maxsize=10000, retries=3):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retries = retries
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='batch-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        # False means the queue is full and the caller should back off
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            return False
+
+    def flush(self):
+        # Block until everything submitted so far has been written
+        self._queue.join()
+
+    def stop(self, timeout=10):
+        # Drain the queue, then let the writer thread exit
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {'pending': self.pending(), 'written': self.written,
+                'batches': self.batches, 'failed': self.failed}
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.max_delay)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch):
+        for attempt in range(1, self.retries + 1):
+            try:
+                self.write_batch(batch)
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except Exception:
+                logger.exception('Batch write failed (attempt %d/%d, %d rows)', attempt, self.retries, len(batch))
+                time.sleep(0.1 * attempt)
+        self.failed += len(batch)
+        logger.error('Dropped %d rows after %d attempts: %r', len(batch), self.retries, batch)
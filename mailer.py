@@ -0,0 +1,76 @@
+import threading, time
+
+def backoff(attempt, base=30, cap=3600):
+    # Seconds to wait before retry number `attempt` (1-based)
+    return min(cap, base * 2 ** (attempt - 1))
+
+class SMTPPool:
+    # Keeps one authenticated SMTP connection open between messages instead
+    # of connecting, STARTTLS-ing and logging in per email. Reconnects when
+    # the server has dropped it and closes it after idle_timeout seconds.
+
+    def __init__(self, host, port, username=None, password=None, starttls=True, timeout=30, idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.connects = 0
+        self._smtp = None
+        self._last_used = 0
+        self._lock = threading.Lock()
+
+    def send(self, msg):
+        # smtplib is imported on first use to keep it out of startup
+        import smtplib
+        with self._lock:
+            try:
+                try:
+                    self._connection().send_message(msg)
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    # Stale connection; one fresh attempt before giving up
+                    self._reset()
+                    self._connection().send_message(msg)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # The message was refused but the connection is still good
+                raise
+            except Exception:
+                self._reset()
+                raise
+            self._last_used = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._reset()
+
+    def close_if_idle(self):
+        with self._lock:
+            if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._reset()
+
+    def _connection(self):
+        import smtplib
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.starttls:
+                    smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password)
+            except Exception:
+                smtp.close()
+                raise
+            self._smtp = smtp
+            self.connects += 1
+        return self._smtp
+
+    def _reset(self):
+        import smtplib
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
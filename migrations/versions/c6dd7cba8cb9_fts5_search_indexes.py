@@ -0,0 +1,66 @@
+"""fts5 search indexes
+
+Revision ID: c6dd7cba8cb9
+Revises: 17c51aec8c0d
+Create Date: 2026-10-18 08:39:55.588422
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6dd7cba8cb9'
+down_revision = '17c51aec8c0d'
+branch_labels = None
+depends_on = None
+
+
+# Copied from search.py at the time of this revision: trigram FTS5
+# indexes over registration and presence, kept in sync by triggers
+STATEMENTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS registration_fts USING fts5(
+        plate, pj_number, owner, institution,
+        content='registration', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS registration_fts_ai AFTER INSERT ON registration BEGIN
+        INSERT INTO registration_fts(rowid, plate, pj_number, owner, institution)
+        VALUES (new.id, new.plate, new.pj_number, new.owner, new.institution);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS registration_fts_ad AFTER DELETE ON registration BEGIN
+        INSERT INTO registration_fts(registration_fts, rowid, plate, pj_number, owner, institution)
+        VALUES ('delete', old.id, old.plate, old.pj_number, old.owner, old.institution);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS registration_fts_au AFTER UPDATE ON registration BEGIN
+        INSERT INTO registration_fts(registration_fts, rowid, plate, pj_number, owner, institution)
+        VALUES ('delete', old.id, old.plate, old.pj_number, old.owner, old.institution);
+        INSERT INTO registration_fts(rowid, plate, pj_number, owner, institution)
+        VALUES (new.id, new.plate, new.pj_number, new.owner, new.institution);
+    END""",
+    "INSERT INTO registration_fts(registration_fts) VALUES ('rebuild')",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS presence_fts USING fts5(
+        plate, content='presence', content_rowid='rowid', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS presence_fts_ai AFTER INSERT ON presence BEGIN
+        INSERT INTO presence_fts(rowid, plate) VALUES (new.rowid, new.plate);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS presence_fts_ad AFTER DELETE ON presence BEGIN
+        INSERT INTO presence_fts(presence_fts, rowid, plate) VALUES ('delete', old.rowid, old.plate);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS presence_fts_au AFTER UPDATE OF plate ON presence BEGIN
+        INSERT INTO presence_fts(presence_fts, rowid, plate) VALUES ('delete', old.rowid, old.plate);
+        INSERT INTO presence_fts(rowid, plate) VALUES (new.rowid, new.plate);
+    END""",
+    "INSERT INTO presence_fts(presence_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade():
+    for statement in STATEMENTS:
+        op.execute(statement)
+
+
+def downgrade():
+    for trigger in ('registration_fts_ai', 'registration_fts_ad', 'registration_fts_au',
+                    'presence_fts_ai', 'presence_fts_ad', 'presence_fts_au'):
+        op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    op.execute("DROP TABLE IF EXISTS registration_fts")
+    op.execute("DROP TABLE IF EXISTS presence_fts")
@@ -0,0 +1,30 @@
+"""movement autoincrement ids
+
+Revision ID: f0e17e0ad0d8
+Revises: 44c454f0e52d
+Create Date: 2026-10-18 08:28:15.970382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f0e17e0ad0d8'
+down_revision = '44c454f0e52d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rebuild movement with AUTOINCREMENT so ids are never reused after
+    # purges; archive restores and incremental watermarks rely on that
+    with op.batch_alter_table('movement', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        pass
+
+
+def downgrade():
+    with op.batch_alter_table('movement', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': False}) as batch_op:
+        pass
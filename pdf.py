@@ -0,0 +1,136 @@
+import struct, zlib
+
+# Minimal streaming PDF writer: text in the built-in Helvetica fonts,
+# lines, filled boxes and PNG images. Pages are written as they are
+# finished and only object offsets are kept, so a report's size is not
+# limited by memory.
+
+A4 = (595.28, 841.89)
+
+def escape_text(text):
+    # Built-in fonts use WinAnsiEncoding (cp1252)
+    data = str(text).encode('cp1252', 'replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+def number(value):
+    return ('%.2f' % value).rstrip('0').rstrip('.').encode()
+
+def png_image(png):
+    # Embed a PNG without decoding it: PDF's Flate filter understands PNG
+    # row predictors, so the IDAT data can be copied as is. Handles the
+    # non-interlaced grayscale and RGB images qrcode produces.
+    if png[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError('Not a PNG image')
+    pos, idat, header = 8, [], None
+    while pos < len(png):
+        length, kind = struct.unpack('>I4s', png[pos:pos + 8])
+        data = png[pos + 8:pos + 8 + length]
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', data)
+        elif kind == b'IDAT':
+            idat.append(data)
+        pos += 12 + length
+    width, height, depth, color_type, _, _, interlace = header
+    if interlace or color_type not in (0, 2):
+        raise ValueError('Only non-interlaced grayscale or RGB PNGs are supported')
+    colors = 1 if color_type == 0 else 3
+    space = b'/DeviceGray' if colors == 1 else b'/DeviceRGB'
+    params = b'<< /Predictor 15 /Colors %d /BitsPerComponent %d /Columns %d >>' % (colors, depth, width)
+    data = b''.join(idat)
+    return (b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent %d '
+            b'/Filter /FlateDecode /DecodeParms %s /Length %d >>' % (width, height, space, depth, params, len(data)), data)
+
+class Page:
+    # Drawing operations for one page; y grows upwards from the bottom edge
+
+    def __init__(self):
+        self.ops = []
+        self.images = []
+
+    def text(self, x, y, text, size=10, bold=False):
+        font = b'/F2' if bold else b'/F1'
+        self.ops.append(b'BT %s %s Tf %s %s Td (%s) Tj ET' % (font, number(size), number(x), number(y), escape_text(text)))
+
+    def line(self, x1, y1, x2, y2, width=0.5):
+        self.ops.append(b'%s w %s %s m %s %s l S' % (number(width), number(x1), number(y1), number(x2), number(y2)))
+
+    def rect(self, x, y, w, h, width=0.5):
+        self.ops.append(b'%s w %s %s %s %s re S' % (number(width), number(x), number(y), number(w), number(h)))
+
+    def box(self, x, y, w, h, gray=0.9):
+        self.ops.append(b'q %s g %s %s %s %s re f Q' % (number(gray), number(x), number(y), number(w), number(h)))
+
+    def image(self, png, x, y, w, h):
+        name = b'/Im%d' % len(self.images)
+        self.images.append(png)
+        self.ops.append(b'q %s 0 0 %s %s %s cm %s Do Q' % (number(w), number(h), number(x), number(y), name))
+
+class PDFStream:
+    # begin(), add_page() for each page, then end(); each returns the bytes
+    # to send next
+
+    CATALOG, PAGES, FONT, BOLD_FONT, INFO = 1, 2, 3, 4, 5
+
+    def __init__(self, page_size=A4, title=None):
+        self.width, self.height = page_size
+        self.title = title
+        self.offsets = {}
+        self.page_ids = []
+        self.position = 0
+        self.next_id = self.INFO + 1
+
+    def _object(self, num, body, stream=None):
+        self.offsets[num] = self.position
+        out = b'%d 0 obj\n%s\n' % (num, body)
+        if stream is not None:
+            out += b'stream\n' + stream + b'\nendstream\n'
+        out += b'endobj\n'
+        self.position += len(out)
+        return out
+
+    def _allocate(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def begin(self):
+        out = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.position = len(out)
+        for num, font in ((self.FONT, b'Helvetica'), (self.BOLD_FONT, b'Helvetica-Bold')):
+            out += self._object(num, b'<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % font)
+        info = b'<< /Producer (CarTrackingSystem)'
+        if self.title:
+            info += b' /Title (%s)' % escape_text(self.title)
+        out += self._object(self.INFO, info + b' >>')
+        return out
+
+    def add_page(self, page):
+        out = b''
+        xobjects = []
+        for i, png in enumerate(page.images):
+            image_id = self._allocate()
+            header, data = png_image(png)
+            out += self._object(image_id, header, data)
+            xobjects.append(b'/Im%d %d 0 R' % (i, image_id))
+        content = zlib.compress(b'\n'.join(page.ops))
+        content_id = self._allocate()
+        out += self._object(content_id, b'<< /Length %d /Filter /FlateDecode >>' % len(content), content)
+        page_id = self._allocate()
+        resources = b'<< /Font << /F1 %d 0 R /F2 %d 0 R >> /XObject << %s >> >>' % (
+            self.FONT, self.BOLD_FONT, b' '.join(xobjects))
+        out += self._object(page_id, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %s %s] /Resources %s /Contents %d 0 R >>' % (
+            self.PAGES, number(self.width), number(self.height), resources, content_id))
+        self.page_ids.append(page_id)
+        return out
+
+    def end(self):
+        kids = b' '.join(b'%d 0 R' % i for i in self.page_ids)
+        out = self._object(self.PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.page_ids)))
+        out += self._object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+        xref_at = self.position
+        count = self.next_id
+        out += b'xref\n0 %d\n0000000000 65535 f \n' % count
+        for i in range(1, count):
+            out += b'%010d 00000 n \n' % self.offsets[i]
+        out += b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            count, self.CATALOG, self.INFO, xref_at)
+        return out
@@ -0,0 +1,77 @@
+import hashlib, io, os, tempfile
+from ttl_cache import TTLCache
+from metrics import timed
+
+def render_png(url):
+    # Module level so it can run in a worker process. qrcode (and PIL) load
+    # on first render, not at startup.
+    import qrcode
+    buf = io.BytesIO()
+    with timed('qr_render'):
+        qrcode.make(url).save(buf)
+    return buf.getvalue()
+
+class QRCache:
+    # Content-addressed PNG cache: the key is the SHA-256 of the encoded URL,
+    # so the same URL always maps to the same image and ETag. Hot images stay
+    # in memory, everything rendered is also kept under directory.
+
+    def __init__(self, directory, maxsize=512):
+        self.directory = directory
+        self.memory = TTLCache(maxsize, ttl=float('inf'))
+        self.renders = 0
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, url):
+        # Returns (key, png bytes), rendering only on a full miss
+        key = self.key(url)
+        png = self.memory.get(key)
+        if png is None:
+            png = self._read(key)
+            if png is None:
+                png = self.render(url)
+                self._write(key, png)
+            self.memory.set(key, png)
+        return key, png
+
+    def render(self, url):
+        self.renders += 1
+        return render_png(url)
+
+    def store(self, url, png):
+        # Adopt an image rendered elsewhere, e.g. by a process pool
+        key = self.key(url)
+        self._write(key, png)
+        self.memory.set(key, png)
+        return key
+
+    def clear(self):
+        self.memory.clear()
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.png'):
+                    os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        return dict(self.memory.stats(), renders=self.renders)
+
+    def _read(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, key, png):
+        # Write to a temp file first so readers never see a partial PNG
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        os.replace(tmp, self.path(key))
@@ -0,0 +1,6 @@
+from app import app, rebuild_presence
+
+if __name__ == "__main__":
+    with app.app_context():
+        count = rebuild_presence()
+        print(f"Occupancy rebuilt from movement history: {count} plates.")
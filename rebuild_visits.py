@@ -0,0 +1,6 @@
+from app import app, rebuild_visits
+
+if __name__ == "__main__":
+    with app.app_context():
+        count = rebuild_visits()
+        print(f"Visits rebuilt from movement history: {count} visits.")
@@ -0,0 +1,47 @@
+import datetime, gzip, json, os, re
+
+# Archived movements live in one gzip'd NDJSON file per month. Each archive
+# run appends a new gzip member, which gzip readers see as one stream.
+ARCHIVE_RE = re.compile(r'^movements-(\d{4}-\d{2})\.ndjson\.gz$')
+
+def archive_path(directory, month):
+    if not re.fullmatch(r'\d{4}-\d{2}', month):
+        raise ValueError(f'Invalid archive month: {month}')
+    return os.path.join(directory, f"movements-{month}.ndjson.gz")
+
+def list_months(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(m.group(1) for m in map(ARCHIVE_RE.match, os.listdir(directory)) if m)
+
+def append_records(directory, month, records):
+    # Durable before returning: the caller deletes the rows right after
+    os.makedirs(directory, exist_ok=True)
+    with open(archive_path(directory, month), 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as gz:
+            for record in records:
+                gz.write((json.dumps(record, default=_encode) + '\n').encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+def read_records(directory, month):
+    # A run interrupted between archiving and deleting archives its chunk
+    # twice, so repeated ids are skipped
+    path = archive_path(directory, month)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    seen = set()
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if record['id'] in seen:
+                continue
+            seen.add(record['id'])
+            if record.get('timestamp'):
+                record['timestamp'] = datetime.datetime.fromisoformat(record['timestamp'])
+            yield record
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f'Cannot archive {type(value).__name__}')
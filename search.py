@@ -0,0 +1,71 @@
+import re
+
+# FTS5 trigram indexes over registration and presence (one row per plate
+# seen at a gate), kept in sync by triggers. Both are external-content
+# tables: they store only the index, the text stays in the source table.
+# A migration that recreates registration or presence (e.g. a batch
+# alter) drops the triggers and must run these statements again.
+
+FTS_TABLES = ('registration_fts', 'presence_fts')
+
+REGISTRATION_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS registration_fts USING fts5(
+        plate, pj_number, owner, institution,
+        content='registration', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS registration_fts_ai AFTER INSERT ON registration BEGIN
+        INSERT INTO registration_fts(rowid, plate, pj_number, owner, institution)
+        VALUES (new.id, new.plate, new.pj_number, new.owner, new.institution);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS registration_fts_ad AFTER DELETE ON registration BEGIN
+        INSERT INTO registration_fts(registration_fts, rowid, plate, pj_number, owner, institution)
+        VALUES ('delete', old.id, old.plate, old.pj_number, old.owner, old.institution);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS registration_fts_au AFTER UPDATE ON registration BEGIN
+        INSERT INTO registration_fts(registration_fts, rowid, plate, pj_number, owner, institution)
+        VALUES ('delete', old.id, old.plate, old.pj_number, old.owner, old.institution);
+        INSERT INTO registration_fts(rowid, plate, pj_number, owner, institution)
+        VALUES (new.id, new.plate, new.pj_number, new.owner, new.institution);
+    END""",
+    "INSERT INTO registration_fts(registration_fts) VALUES ('rebuild')",
+]
+
+PRESENCE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS presence_fts USING fts5(
+        plate, content='presence', content_rowid='rowid', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS presence_fts_ai AFTER INSERT ON presence BEGIN
+        INSERT INTO presence_fts(rowid, plate) VALUES (new.rowid, new.plate);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS presence_fts_ad AFTER DELETE ON presence BEGIN
+        INSERT INTO presence_fts(presence_fts, rowid, plate) VALUES ('delete', old.rowid, old.plate);
+    END""",
+    # Upserts only change the last scan, so only a new plate needs reindexing
+    """CREATE TRIGGER IF NOT EXISTS presence_fts_au AFTER UPDATE OF plate ON presence BEGIN
+        INSERT INTO presence_fts(presence_fts, rowid, plate) VALUES ('delete', old.rowid, old.plate);
+        INSERT INTO presence_fts(rowid, plate) VALUES (new.rowid, new.plate);
+    END""",
+    "INSERT INTO presence_fts(presence_fts) VALUES ('rebuild')",
+]
+
+def quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+def compact(text):
+    # Plates are stored without spaces: "kaa 98" -> "KAA98"
+    return re.sub(r'\s+', '', text).upper()
+
+def registration_match(q):
+    # Plate fragments match with spaces removed; owner and institution
+    # match the text as typed. Trigram queries need at least 3 characters.
+    parts = []
+    if len(compact(q)) >= 3:
+        parts.append(f"{{plate pj_number}} : {quote(compact(q))}")
+    if len(q.strip()) >= 3:
+        parts.append(f"{{owner institution}} : {quote(q.strip())}")
+    return ' OR '.join(parts) or None
+
+def plate_match(q):
+    return quote(compact(q)) if len(compact(q)) >= 3 else None
+
+def is_fts_object(name, type_):
+    # Keep alembic autogenerate from proposing to drop the index tables
+    return type_ == 'table' and name.startswith(FTS_TABLES)
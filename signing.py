@@ -0,0 +1,61 @@
+import hmac, base64, hashlib
+from collections import namedtuple
+
+# Signed QR payloads, "<key id>.<registration id>.<issued>.<plate>.<signature>",
+# checked with HMAC-SHA256 against an in-memory keyring so a scan of a valid
+# code needs no database lookup. Numbers are base 36 and the signature is
+# cut to 128 bits to keep the QR code small.
+
+ScanCode = namedtuple('ScanCode', 'key_id registration_id issued plate')
+
+def base36(n):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    out = ''
+    while True:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+        if not n:
+            return out
+
+def parse_keys(spec):
+    # "k2:secret,k1:older-secret" -> {'k2': b'secret', 'k1': b'older-secret'}
+    keys = {}
+    for item in filter(None, (s.strip() for s in spec.split(','))):
+        key_id, sep, secret = item.partition(':')
+        if not sep or not key_id or not secret or '.' in key_id:
+            raise ValueError(f'Invalid signing key entry: {key_id or item}')
+        keys[key_id] = secret.encode()
+    return keys
+
+class CodeSigner:
+    # The first key signs new codes; the others are still accepted, so a
+    # key can be rotated without reprinting, then retired to revoke its codes
+
+    def __init__(self, keys):
+        if not keys:
+            raise ValueError('At least one signing key is required')
+        self.keys = dict(keys)
+        self.current = next(iter(self.keys))
+
+    def _signature(self, key, payload):
+        digest = hmac.new(key, payload.encode(), hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+    def sign(self, plate, registration_id, issued):
+        payload = f"{self.current}.{base36(registration_id)}.{base36(int(issued))}.{plate}"
+        return f"{payload}.{self._signature(self.keys[self.current], payload)}"
+
+    def verify(self, code):
+        # Returns a ScanCode; raises ValueError for a code that is malformed,
+        # signed with an unknown key or tampered with
+        payload, _, signature = code.rpartition('.')
+        parts = payload.split('.', 3)
+        if len(parts) != 4:
+            raise ValueError('Malformed code')
+        key = self.keys.get(parts[0])
+        if key is None:
+            raise ValueError('Unknown signing key')
+        # Bytes, as compare_digest refuses non-ASCII str
+        if not hmac.compare_digest(signature.encode(), self._signature(key, payload).encode()):
+            raise ValueError('Invalid signature')
+        return ScanCode(parts[0], int(parts[1], 36), int(parts[2], 36), parts[3])
@@ -0,0 +1,42 @@
+import os, sqlite3, time, pathlib, datetime
+
+# Reporting copy of the live database for heavy admin reads, taken with
+# SQLite's online backup API. The copy is consistent as of the moment the
+# backup ran; its mtime says when that was.
+
+def take_snapshot(source, target, busy_timeout=30):
+    # source is an open sqlite3 connection to the live database. All pages
+    # are copied in one step under a single read lock, so gate writes wait
+    # at most for the copy and the result is never a mix of two states.
+    # Readers of the old copy make the backup wait and retry until they
+    # finish; new readers wait briefly while it is written.
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    dst = sqlite3.connect(target, timeout=busy_timeout)
+    try:
+        source.backup(dst, sleep=0.05)
+    finally:
+        dst.close()
+    os.utime(target)
+
+def taken_at(target):
+    # Naive UTC, or None until the first snapshot exists
+    try:
+        return datetime.datetime.fromtimestamp(os.path.getmtime(target), datetime.timezone.utc).replace(tzinfo=None)
+    except OSError:
+        return None
+
+def age_seconds(target):
+    try:
+        return max(0.0, time.time() - os.path.getmtime(target))
+    except OSError:
+        return None
+
+def read_only_uri(target):
+    return pathlib.Path(target).resolve().as_uri() + '?mode=ro'
+
+def describe_age(seconds):
+    if seconds < 90:
+        return f"{int(seconds)} s"
+    if seconds < 5400:
+        return f"{int(seconds // 60)} min"
+    return f"{seconds / 3600:.1f} h"
@@ -0,0 +1,148 @@
+import json, datetime, threading, pytest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from sqlalchemy import event
+from app import (app, db, Registration, RejectedScan, Alert,
+                 evaluate_alerts, deliver_alert_webhooks)
+from webhook import signature
+
+NOW = datetime.datetime(2024, 3, 2, 12, 0)
+
+@pytest.fixture(autouse=True)
+def rules(monkeypatch, gate_device, no_debounce):
+    monkeypatch.setitem(app.config, 'OVERSTAY_HOURS', 12)
+    monkeypatch.setitem(app.config, 'REJECTION_ALERT_COUNT', 3)
+    monkeypatch.setitem(app.config, 'REJECTION_ALERT_WINDOW', 600)
+    monkeypatch.setitem(app.config, 'ALERT_WEBHOOK_URL', '')
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ001', plate='KAA001A', owner='Driver One', institution='0700000000'))
+        db.session.commit()
+
+def scan(plate, action, at):
+    # Movements as recorded by /track, without going through the clock
+    from app import record_movements
+    with app.app_context():
+        record_movements([{'plate': plate, 'action': action, 'timestamp': at, 'gate': 'north'}])
+
+def alerts():
+    with app.app_context():
+        return [(a.rule, a.plate) for a in Alert.query.order_by(Alert.id)]
+
+def evaluate(now):
+    with app.app_context():
+        return evaluate_alerts(now)
+
+def test_overstay_raised_once_when_limit_passes():
+    scan('KAA001A', 'entry', NOW - datetime.timedelta(hours=11))
+    assert evaluate(NOW) == 0
+    assert evaluate(NOW + datetime.timedelta(hours=2)) == 1
+    assert evaluate(NOW + datetime.timedelta(hours=3)) == 0
+    assert alerts() == [('overstay', 'KAA001A')]
+
+def test_exit_before_limit_raises_nothing():
+    scan('KAA001A', 'entry', NOW - datetime.timedelta(hours=11))
+    evaluate(NOW)
+    scan('KAA001A', 'exit', NOW)
+    assert evaluate(NOW + datetime.timedelta(hours=2)) == 0
+
+def test_late_upload_of_old_entry_is_caught():
+    evaluate(NOW)
+    # A gate that was offline uploads an entry from yesterday
+    scan('KAA001A', 'entry', NOW - datetime.timedelta(hours=20))
+    assert evaluate(NOW + datetime.timedelta(minutes=1)) == 1
+
+def test_pass_reads_only_new_events():
+    for i in range(50):
+        scan(f'KZZ{i:03d}Z', 'entry', NOW - datetime.timedelta(hours=30))
+    assert evaluate(NOW) == 50
+    with app.app_context():
+        engine = db.engine
+    rows = []
+    listener = lambda conn, cursor, statement, params, context, executemany: rows.append(cursor.rowcount)
+    event.listen(engine, 'after_cursor_execute', listener)
+    try:
+        assert evaluate(NOW + datetime.timedelta(minutes=1)) == 0
+    finally:
+        event.remove(engine, 'after_cursor_execute', listener)
+    assert len(rows) < 10
+
+def test_repeated_unregistered_scans_raise_one_alert():
+    client = app.test_client()
+    for _ in range(5):
+        assert client.get('/track/KXX999X/entry?token=gate-token&gate=north').status_code == 404
+    with app.app_context():
+        assert RejectedScan.query.count() == 5
+    assert evaluate(datetime.datetime.utcnow()) == 1
+    assert alerts() == [('repeated_rejection', 'KXX999X')]
+    # Already consumed
+    assert evaluate(datetime.datetime.utcnow()) == 0
+
+def test_rejections_outside_window_do_not_add_up():
+    with app.app_context():
+        for minutes in (0, 15, 30):
+            db.session.add(RejectedScan(plate='KXX999X', reason='not_registered',
+                                        timestamp=NOW + datetime.timedelta(minutes=minutes)))
+        db.session.commit()
+    assert evaluate(NOW + datetime.timedelta(hours=1)) == 0
+
+def test_batch_upload_logs_unregistered_plates():
+    app.test_client().post('/track/batch?token=gate-token', json=[
+        {'plate': 'KXX999X', 'action': 'entry'} for _ in range(3)])
+    assert evaluate(datetime.datetime.utcnow()) == 1
+
+class StandIn(BaseHTTPRequestHandler):
+    received = []
+    fail = False
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        StandIn.received.append((json.loads(body), self.headers.get('X-Signature'), body))
+        self.send_response(500 if StandIn.fail else 204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def webhook_server(monkeypatch):
+    StandIn.received, StandIn.fail = [], False
+    server = HTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(app.config, 'ALERT_WEBHOOK_URL', f'http://127.0.0.1:{server.server_port}/hook')
+    monkeypatch.setitem(app.config, 'ALERT_WEBHOOK_SECRET', 's3cret')
+    yield StandIn
+    server.shutdown()
+    server.server_close()
+
+def test_webhook_delivery(webhook_server):
+    scan('KAA001A', 'entry', NOW - datetime.timedelta(hours=13))
+    evaluate(NOW)
+    with app.app_context():
+        assert deliver_alert_webhooks() == 1
+        assert Alert.query.one().webhook_status == 'sent'
+        assert deliver_alert_webhooks() == 0
+    payload, sig, body = webhook_server.received[0]
+    assert (payload['rule'], payload['plate']) == ('overstay', 'KAA001A')
+    assert sig == signature('s3cret', body)
+
+def test_webhook_failure_is_retried_later(webhook_server):
+    webhook_server.fail = True
+    scan('KAA001A', 'entry', NOW - datetime.timedelta(hours=13))
+    evaluate(NOW)
+    with app.app_context():
+        assert deliver_alert_webhooks() == 1
+        alert = Alert.query.one()
+        assert (alert.webhook_status, alert.webhook_attempts) == ('pending', 1)
+        assert alert.next_attempt_at > datetime.datetime.utcnow()
+        assert deliver_alert_webhooks() == 0
+
+def test_inbox_and_acknowledge(admin_client):
+    scan('KAA001A', 'entry', NOW - datetime.timedelta(hours=13))
+    evaluate(NOW)
+    client = admin_client
+    page = client.get('/alerts')
+    assert b'KAA001A' in page.data and b'has not left' in page.data
+    with app.app_context():
+        alert_id = Alert.query.one().id
+    client.post(f'/alerts/{alert_id}/ack')
+    assert b'No open alerts' in client.get('/alerts').data
+    assert b'Acknowledged by admin' in client.get('/alerts?show=all').data
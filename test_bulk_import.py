@@ -0,0 +1,53 @@
+import io, time, pytest
+from app import app, Registration
+
+pytestmark = pytest.mark.usefixtures('gate')
+
+def upload(client, text, filename='fleet.csv'):
+    return client.post('/import-vehicles', data={'file': (io.BytesIO(text.encode()), filename)},
+                       content_type='multipart/form-data')
+
+def wait_for(client, job_id):
+    for _ in range(100):
+        progress = client.get(f"/import-vehicles/{job_id}").get_json()
+        if progress['status'] == 'done':
+            return progress
+        time.sleep(0.1)
+
+def test_import_reports_each_row_and_renders_qr(tmp_path, admin_client, monkeypatch):
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    client = admin_client
+    response = upload(client, 'PJ Number,Plate,Driver Name,Phone Number,ID Number\n'
+                              'PJ100,kcd111a,Jane,0711,1\n'
+                              'PJ001,KCD222B,Dup PJ,0722,2\n'
+                              'PJ101,KAA987M,Dup Plate,0733,3\n'
+                              'PJ102,,No Plate,0744,4\n'
+                              'PJ100,KCD333C,Dup In File,0755,5\n'
+                              'PJ103,KCD444D,John,0766,6\n')
+    assert response.status_code == 202
+    data = response.get_json()
+    assert [r['status'] for r in data['report']] == ['accepted', 'duplicate', 'duplicate', 'invalid', 'duplicate', 'accepted']
+    assert data['report'][0]['row'] == 2
+    assert data['imported'] == 2
+    assert wait_for(client, data['job_id'])['rendered'] == 2
+    assert (tmp_path / 'KCD111A.png').exists()
+    with app.app_context():
+        assert Registration.query.filter_by(plate='KCD444D').first().qr_path == 'static/KCD444D.png'
+
+def test_plate_cannot_escape_static_folder(tmp_path, admin_client, monkeypatch):
+    static = tmp_path / 'static'
+    static.mkdir()
+    monkeypatch.setattr(app, 'static_folder', str(static))
+    response = upload(admin_client, 'PJ Number,Plate\nPJ100,../kcd111a\n')
+    assert wait_for(admin_client, response.get_json()['job_id'])['rendered'] == 1
+    assert not (tmp_path / 'KCD111A.png').exists()
+    assert (static / 'KCD111A.png').exists()
+    with app.app_context():
+        assert Registration.query.filter_by(pj_number='PJ100').first().qr_path == 'static/KCD111A.png'
+
+def test_import_requires_header(admin_client):
+    response = upload(admin_client, 'KAA1,PJ9\n')
+    assert response.status_code == 400
+
+def test_unknown_job(admin_client):
+    assert admin_client.get('/import-vehicles/nope').status_code == 404
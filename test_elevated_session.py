@@ -0,0 +1,50 @@
+import pytest
+from unittest import mock
+from app import app, db, Admin, Registration, Movement, Presence
+
+@pytest.fixture(autouse=True)
+def vehicles(admin):
+    with app.app_context():
+        for i in range(4):
+            db.session.add(Registration(pj_number=f'PJ00{i}', plate=f'KAA00{i}A', owner='Driver', institution='0700'))
+            db.session.add(Movement(plate=f'KAA00{i}A', action='entry'))
+            db.session.add(Presence(plate=f'KAA00{i}A', last_action='entry', last_timestamp=db.func.now()))
+        db.session.commit()
+
+def test_password_checked_once_per_window(admin_client):
+    client = admin_client
+    with mock.patch.object(Admin, 'check_password', autospec=True, side_effect=lambda self, pw: pw == 'admin123') as check:
+        client.post('/delete/1', data={'admin_password': 'admin123'})
+        client.post('/delete/2', data={})
+        assert check.call_count == 1
+    with app.app_context():
+        assert Registration.query.count() == 2
+
+def test_wrong_password_does_not_elevate(admin_client):
+    client = admin_client
+    client.post('/delete/1', data={'admin_password': 'wrong'})
+    client.post('/delete/1', data={})
+    with app.app_context():
+        assert Registration.query.count() == 4
+
+def test_window_expires(admin_client):
+    client = admin_client
+    client.post('/delete/1', data={'admin_password': 'admin123'})
+    with client.session_transaction() as sess:
+        sess['elevated_until'] = 0
+    client.post('/delete/2', data={})
+    with app.app_context():
+        assert Registration.query.count() == 3
+
+def test_bulk_delete_removes_vehicles_and_movements(admin_client):
+    client = admin_client
+    assert client.post('/vehicles/bulk-delete', json={'ids': [1, 2]}).status_code == 403
+    response = client.post('/vehicles/bulk-delete', json={'ids': [1, 2, 99], 'password': 'admin123'})
+    data = response.get_json()
+    assert data['success'] and data['deleted'] == 2 and data['movements_deleted'] == 2
+    # Still inside the window: no password needed
+    assert client.post('/vehicles/bulk-delete', json={'ids': [3]}).get_json()['deleted'] == 1
+    with app.app_context():
+        assert [r.plate for r in Registration.query] == ['KAA003A']
+        assert [m.plate for m in Movement.query] == ['KAA003A']
+        assert [p.plate for p in Presence.query] == ['KAA003A']
@@ -0,0 +1,35 @@
+import csv, io, json, datetime, pytest
+from app import app, db, Movement
+
+@pytest.fixture(autouse=True)
+def movements(monkeypatch):
+    monkeypatch.setitem(app.config, 'EXPORT_CHUNK_SIZE', 3)
+    with app.app_context():
+        base = datetime.datetime(2024, 1, 1, 8, 0, 0)
+        for i in range(10):
+            db.session.add(Movement(plate='KAA987M' if i % 2 else 'KBB123X', action='entry',
+                                    timestamp=base + datetime.timedelta(days=i), gate='north' if i % 2 else None))
+        db.session.commit()
+
+def test_csv_export_streams_all_rows(admin_client):
+    response = admin_client.get('/export_movements')
+    assert response.status_code == 200
+    assert response.is_streamed
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert len(rows) == 10
+    assert rows[0]['timestamp'].startswith('2024-01-01T11:00:00')
+    assert [r['gate'] for r in rows[:2]] == ['', 'north']
+
+def test_ndjson_export_applies_filters(admin_client):
+    response = admin_client.get('/export_movements?format=ndjson&plate=KAA987M&date_to=2024-01-05')
+    lines = response.get_data(as_text=True).splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [(r['plate'], r['gate']) for r in records] == [('KAA987M', 'north'), ('KAA987M', 'north')]
+
+def test_export_requires_login():
+    response = app.test_client().get('/export_movements')
+    assert response.status_code == 302
+
+def test_unknown_format_rejected(admin_client):
+    response = admin_client.get('/export_movements?format=xml')
+    assert response.status_code == 400
@@ -0,0 +1,76 @@
+import datetime, pytest
+from app import app, Movement, recent_keys, write_movement_batch
+from ttl_cache import TTLCache
+
+pytestmark = pytest.mark.usefixtures('gate', 'no_debounce')
+
+def scan(action, key=None, **params):
+    query = '&'.join(f'{k}={v}' for k, v in params.items())
+    headers = {'Idempotency-Key': key} if key else {}
+    return app.test_client().get(f'/track/KAA987M/{action}?token=gate-token&{query}', headers=headers)
+
+def stored():
+    with app.app_context():
+        return [(m.action, m.idempotency_key) for m in Movement.query.order_by(Movement.id)]
+
+def test_ttl_cache_add_only_stores_absent_keys():
+    cache = TTLCache(10, ttl=60)
+    assert cache.add('a', 1)
+    assert not cache.add('a', 2)
+    assert cache.get('a') == 1
+
+def test_retried_scan_is_recorded_once():
+    assert scan('auto', 'k-1').get_json()['action'] == 'entry'
+    response = scan('auto', 'k-1')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'duplicate'
+    assert response.get_json()['action'] == 'entry'
+    # A new scan with its own key is still recorded
+    assert scan('auto', 'k-2').get_json()['action'] == 'exit'
+    assert stored() == [('entry', 'k-1'), ('exit', 'k-2')]
+
+def test_key_as_query_parameter():
+    scan('entry', idempotency_key='k-1')
+    assert scan('entry', idempotency_key='k-1').get_json()['status'] == 'duplicate'
+    assert stored() == [('entry', 'k-1')]
+
+def test_unique_index_catches_keys_no_longer_cached():
+    scan('entry', 'k-1')
+    recent_keys.clear()
+    response = scan('exit', 'k-1').get_json()
+    assert (response['status'], response['action']) == ('duplicate', 'entry')
+    assert stored() == [('entry', 'k-1')]
+
+def test_replayed_queue_is_not_debounced(monkeypatch):
+    monkeypatch.setitem(app.config, 'SCAN_DEBOUNCE_SECONDS', 10)
+    queue = [('auto', 'q-1', '2024-01-02T05:00:00Z'), ('auto', 'q-2', '2024-01-02T06:30:00Z'),
+             ('auto', 'q-3', '2024-01-02T06:30:04Z'), ('auto', 'q-4', '2024-01-02T08:00:00Z')]
+    responses = [scan(action, key, client_timestamp=ts).get_json() for action, key, ts in queue]
+    # Only the tap four seconds after the 06:30 exit is a double tap
+    assert [r['status'] for r in responses] == ['success', 'success', 'duplicate', 'success']
+    assert stored() == [('entry', 'q-1'), ('exit', 'q-2'), ('entry', 'q-4')]
+
+def test_client_timestamp_is_kept():
+    scan('entry', 'k-1', client_timestamp='2024-01-02T03:04:05Z')
+    with app.app_context():
+        assert str(Movement.query.one().timestamp) == '2024-01-02 03:04:05'
+    assert scan('entry', 'k-2', client_timestamp='yesterday').status_code == 400
+
+def test_overlong_key_is_rejected():
+    assert scan('entry', 'x' * 65).status_code == 400
+    assert stored() == []
+
+def test_batch_upload_skips_keys_seen_by_track():
+    scan('entry', 'k-1')
+    response = app.test_client().post('/track/batch?token=gate-token', json=[
+        {'plate': 'KAA987M', 'action': 'entry', 'idempotency_key': 'k-1'},
+        {'plate': 'KAA987M', 'action': 'exit', 'idempotency_key': 'k-2'}])
+    assert [r['status'] for r in response.get_json()['results']] == ['duplicate', 'accepted']
+    assert scan('exit', 'k-2').get_json()['status'] == 'duplicate'
+
+def test_batch_writer_drops_rows_already_stored():
+    scan('entry', 'k-1')
+    now = datetime.datetime.utcnow()
+    write_movement_batch([{'plate': 'KAA987M', 'action': 'entry', 'timestamp': now, 'idempotency_key': 'k-1', 'gate': None},
+                          {'plate': 'KAA987M', 'action': 'exit', 'timestamp': now, 'idempotency_key': 'k-2', 'gate': None}])
+    assert stored() == [('entry', 'k-1'), ('exit', 'k-2')]
@@ -0,0 +1,44 @@
+import threading, pytest
+from app import app, Movement, movement_writer
+from ingest import BatchWriter
+
+pytestmark = pytest.mark.usefixtures('gate')
+
+def test_batch_writer_groups_rows():
+    batches = []
+    writer = BatchWriter(batches.append, max_batch=50, max_delay=0.2)
+    for i in range(120):
+        assert writer.submit(i)
+    writer.flush()
+    writer.stop()
+    assert sorted(sum(batches, [])) == list(range(120))
+    assert max(len(b) for b in batches) == 50
+    assert writer.stats()['written'] == 120
+
+def test_batch_writer_rejects_when_full():
+    release = threading.Event()
+    writer = BatchWriter(lambda rows: release.wait(), max_batch=1, max_delay=0.01, maxsize=2)
+    results = [writer.submit(i) for i in range(5)]
+    release.set()
+    writer.flush()
+    writer.stop()
+    assert False in results
+
+def test_stop_drains_queue():
+    written = []
+    writer = BatchWriter(written.extend, max_batch=10, max_delay=0.5)
+    for i in range(25):
+        writer.submit(i)
+    writer.stop()
+    assert len(written) == 25
+
+def test_batched_mode_track(monkeypatch):
+    monkeypatch.setitem(app.config, 'INGEST_MODE', 'batched')
+    client = app.test_client()
+    for action in ('entry', 'exit', 'entry'):
+        response = client.get(f'/track/KAA987M/{action}?token=gate-token')
+        assert response.status_code == 202
+        assert response.get_json()['status'] == 'queued'
+    movement_writer.flush()
+    with app.app_context():
+        assert [m.action for m in Movement.query.order_by(Movement.id)] == ['entry', 'exit', 'entry']
@@ -0,0 +1,61 @@
+import json, pytest
+from app import app, db, Registration, Movement, movement_hub
+from broadcast import BroadcastHub
+
+@pytest.fixture(autouse=True)
+def streams(gate, monkeypatch):
+    monkeypatch.setitem(app.config, 'SSE_KEEPALIVE', 0.05)
+    monkeypatch.setitem(app.config, 'SSE_MAX_DURATION', 0.5)
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ002', plate='KBB123X', owner='Other Driver', institution='0711111111'))
+        db.session.commit()
+
+def read_events(response):
+    body = b''.join(response.response).decode()
+    response.close()
+    return [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+
+def test_hub_drops_subscriber_that_falls_behind():
+    hub = BroadcastHub(buffer_size=2)
+    slow, fast = hub.subscribe(), hub.subscribe()
+    for i in range(3):
+        hub.publish({'id': i})
+        fast.get(0)
+    assert slow.dropped and not fast.dropped
+    assert hub.stats() == {'subscribers': 1, 'published': 3, 'dropped': 1}
+
+def test_hub_limits_subscribers():
+    hub = BroadcastHub(max_subscribers=1)
+    first = hub.subscribe()
+    assert hub.subscribe() is None
+    hub.unsubscribe(first)
+    assert hub.subscribe() is not None
+
+def test_stream_pushes_new_scans(admin_client):
+    response = admin_client.get('/view-logs/stream?plate=kaa987m', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    gate = app.test_client()
+    gate.get('/track/KBB123X/entry?token=gate-token')
+    gate.get('/track/KAA987M/entry?token=gate-token&gate=north')
+    events = read_events(response)
+    assert [(e['plate'], e['action'], e['gate']) for e in events] == [('KAA987M', 'entry', 'north')]
+    assert movement_hub.stats()['subscribers'] == 0
+
+def test_reconnect_backfills_missed_rows(admin_client, monkeypatch):
+    gate = app.test_client()
+    for action in ('entry', 'exit', 'entry'):
+        gate.get(f'/track/KAA987M/{action}?token=gate-token')
+    with app.app_context():
+        first_id = db.session.query(db.func.min(Movement.id)).scalar()
+    monkeypatch.setitem(app.config, 'SSE_MAX_DURATION', 0)
+    response = admin_client.get('/view-logs/stream', headers={'Last-Event-ID': str(first_id)}, buffered=False)
+    assert [e['action'] for e in read_events(response)] == ['exit', 'entry']
+
+def test_stream_requires_admin_and_free_slot(admin_client):
+    assert app.test_client().get('/view-logs/stream').status_code == 401
+    held = [movement_hub.subscribe() for _ in range(app.config['SSE_MAX_CLIENTS'])]
+    try:
+        assert admin_client.get('/view-logs/stream').status_code == 503
+    finally:
+        for subscriber in held:
+            movement_hub.unsubscribe(subscriber)
@@ -0,0 +1,110 @@
+import socketserver, threading, datetime
+from app import app, db, Outbox, deliver_outbox, smtp_pool, queue_email
+
+class StandInSMTP(socketserver.StreamRequestHandler):
+    # Just enough SMTP for smtplib.send_message; can be told to refuse
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.wfile.write(b'220 stand-in ready\r\n')
+        data, in_data = [], False
+        for raw in self.rfile:
+            line = raw.decode().rstrip('\r\n')
+            if in_data:
+                if line == '.':
+                    in_data = False
+                    server.messages.append('\n'.join(data))
+                    data = []
+                    self.wfile.write(b'250 queued\r\n')
+                else:
+                    data.append(line)
+                continue
+            verb = line[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.wfile.write(b'250 stand-in\r\n')
+            elif verb == 'MAIL' and server.refuse:
+                self.wfile.write(b'451 try again later\r\n')
+            elif verb == 'DATA':
+                in_data = True
+                self.wfile.write(b'354 go ahead\r\n')
+            elif verb == 'QUIT':
+                self.wfile.write(b'221 bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 ok\r\n')
+
+def start_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), StandInSMTP)
+    server.daemon_threads = True
+    server.messages, server.connections, server.refuse = [], 0, False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def setup_function():
+    smtp_pool.close()
+
+def point_pool_at(server):
+    smtp_pool.host, smtp_pool.port = server.server_address
+    smtp_pool.starttls = False
+    smtp_pool.username = None
+
+def add_mail(n):
+    with app.app_context():
+        for i in range(n):
+            db.session.add(Outbox(to_email=f'admin{i}@judiciary.go.ke', subject='Password Reset', body=f'token {i}'))
+        db.session.commit()
+
+def test_outbox_delivered_over_one_connection():
+    server = start_server()
+    point_pool_at(server)
+    add_mail(3)
+    with app.app_context():
+        assert deliver_outbox() == 3
+        assert {m.status for m in Outbox.query} == {'sent'}
+    smtp_pool.close()
+    server.shutdown()
+    assert len(server.messages) == 3
+    assert server.connections == 1
+
+def test_failed_mail_is_retried_with_backoff():
+    server = start_server()
+    point_pool_at(server)
+    server.refuse = True
+    add_mail(1)
+    with app.app_context():
+        deliver_outbox()
+        mail = Outbox.query.one()
+        assert mail.status == 'pending' and mail.attempts == 1
+        assert mail.next_attempt_at > datetime.datetime.utcnow()
+        # Not due yet, so the next pass skips it
+        server.refuse = False
+        deliver_outbox()
+        assert Outbox.query.one().status == 'pending'
+        mail = Outbox.query.one()
+        mail.next_attempt_at = datetime.datetime.utcnow()
+        db.session.commit()
+        deliver_outbox()
+        assert Outbox.query.one().status == 'sent'
+    smtp_pool.close()
+    server.shutdown()
+
+def test_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setitem(app.config, 'MAIL_MAX_ATTEMPTS', 1)
+    smtp_pool.host, smtp_pool.port = '127.0.0.1', 1  # nothing listens here
+    add_mail(1)
+    with app.app_context():
+        deliver_outbox()
+        assert Outbox.query.one().status == 'failed'
+
+def test_queue_email_is_delivered_by_worker():
+    server = start_server()
+    point_pool_at(server)
+    with app.app_context():
+        queue_email('admin@judiciary.go.ke', 'Password Reset', 'token')
+    for _ in range(50):
+        if server.messages:
+            break
+        threading.Event().wait(0.1)
+    assert 'token' in server.messages[0]
+    smtp_pool.close()
+    server.shutdown()
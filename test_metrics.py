@@ -0,0 +1,63 @@
+import logging, pytest
+from app import app
+from metrics import Histogram, render_all, registry
+
+pytestmark = pytest.mark.usefixtures('gate', 'admin')
+
+@pytest.fixture(autouse=True)
+def metrics_config(monkeypatch):
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', '')
+    monkeypatch.setitem(app.config, 'SLOW_REQUEST_MS', 0)
+
+def metric_value(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram('test_latency_seconds', 'Test.', ['route'], buckets=(0.1, 1))
+    try:
+        for value in (0.05, 0.5, 5):
+            h.observe(value, route='/x')
+        lines = h.render()
+        assert 'test_latency_seconds_bucket{route="/x",le="0.1"} 1' in lines
+        assert 'test_latency_seconds_bucket{route="/x",le="1"} 2' in lines
+        assert 'test_latency_seconds_bucket{route="/x",le="+Inf"} 3' in lines
+        assert 'test_latency_seconds_count{route="/x"} 3' in lines
+    finally:
+        registry.remove(h)
+
+def test_metrics_count_requests_sql_and_password_checks():
+    client = app.test_client()
+    before = render_all()
+    client.get('/track/KAA987M/entry?token=gate-token')
+    client.post('/admin-login', data={'username': 'admin', 'password': 'admin123'})
+    text = client.get('/metrics').get_data(as_text=True)
+    route = 'route="/track/<plate>/<action>"'
+    for prefix in (f'http_requests_total{{{route},method="GET",status="200"}}',
+                   f'http_request_sql_statements_count{{{route}}}',
+                   'operation_duration_seconds_count{operation="password_hash_check"}'):
+        assert metric_value(text, prefix) == metric_value(before, prefix) + 1
+    # A scan checks the token and plate, then inserts the movement and presence
+    assert metric_value(text, f'http_request_sql_statements_sum{{{route}}}') - \
+        metric_value(before, f'http_request_sql_statements_sum{{{route}}}') >= 3
+
+def test_metrics_require_admin_or_token(monkeypatch):
+    assert app.test_client().get('/metrics').status_code == 401
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'scrape-me')
+    client = app.test_client()
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert response.status_code == 200
+    assert '# TYPE http_request_duration_seconds histogram' in response.get_data(as_text=True)
+
+def test_slow_request_log_is_opt_in(caplog, monkeypatch):
+    client = app.test_client()
+    with caplog.at_level(logging.WARNING):
+        client.get('/track/KAA987M/entry?token=gate-token')
+        assert 'Slow request' not in caplog.text
+        monkeypatch.setitem(app.config, 'SLOW_REQUEST_MS', 0.000001)
+        client.get('/track/KAA987M/exit?token=gate-token')
+    assert 'Slow request: GET /track/KAA987M/exit -> 200' in caplog.text
+    assert 'gate-token' not in caplog.text
@@ -0,0 +1,37 @@
+import datetime, pytest
+from app import app, db, Registration, Movement, Presence, rebuild_presence
+
+@pytest.fixture(autouse=True)
+def vehicles(gate):
+    with app.app_context():
+        for i, plate in enumerate(('KBB123X', 'KCC555Z'), 2):
+            db.session.add(Registration(pj_number=f'PJ00{i}', plate=plate, owner='Driver', institution='0700000000'))
+        db.session.commit()
+
+def test_track_keeps_occupancy_current(admin_client):
+    client = admin_client
+    client.get('/track/KAA987M/entry?token=gate-token&gate=Gate 3')
+    client.get('/track/KBB123X/entry?token=gate-token')
+    client.get('/track/KBB123X/exit?token=gate-token')
+    data = client.get('/occupancy').get_json()
+    assert data['count'] == 1
+    assert data['vehicles'][0]['plate'] == 'KAA987M'
+    assert data['vehicles'][0]['gate'] == 'Gate 3'
+
+def test_late_batch_upload_does_not_rewind_presence(admin_client):
+    client = admin_client
+    client.get('/track/KAA987M/exit?token=gate-token')
+    client.post('/track/batch?token=gate-token', json=[
+        {'plate': 'KAA987M', 'action': 'entry', 'client_timestamp': '2020-01-01T08:00:00Z'}])
+    assert client.get('/occupancy').get_json()['count'] == 0
+
+def test_rebuild_matches_incremental_state():
+    base = datetime.datetime(2024, 1, 1, 8, 0, 0)
+    with app.app_context():
+        for i, (plate, action) in enumerate([('KAA987M', 'entry'), ('KBB123X', 'entry'), ('KAA987M', 'exit'),
+                                             ('KCC555Z', 'entry'), ('KAA987M', 'entry')]):
+            db.session.add(Movement(plate=plate, action=action, timestamp=base + datetime.timedelta(minutes=i)))
+        db.session.commit()
+        assert rebuild_presence(chunk_size=2) == 3
+        state = {p.plate: p.last_action for p in Presence.query}
+        assert state == {'KAA987M': 'entry', 'KBB123X': 'entry', 'KCC555Z': 'entry'}
@@ -0,0 +1,92 @@
+import datetime, re, zlib
+from app import app, db, Registration, Movement, qr_cache
+from pdf import Page, PDFStream, png_image
+from qr_cache import render_png
+
+def setup_function():
+    with app.app_context():
+        for i in range(14):
+            db.session.add(Registration(pj_number=f'PJ{i:03d}', plate=f'KAA{i:03d}A', owner=f'Driver {i}',
+                                        institution='Milimani' if i % 2 else 'Kibera'))
+        start = datetime.datetime(2024, 3, 1, 5, 0)
+        db.session.execute(db.insert(Movement), [
+            {'plate': f'KAA{i % 14:03d}A', 'action': 'entry' if i % 2 == 0 else 'exit',
+             'timestamp': start + datetime.timedelta(minutes=i), 'gate': 'north'} for i in range(130)])
+        db.session.commit()
+
+def page_count(body):
+    return int(re.search(rb'/Type /Pages /Kids \[[^\]]*\] /Count (\d+)', body).group(1))
+
+def page_text(body):
+    # Decompressed content streams, to look for the text drawn on pages
+    streams = re.findall(rb'/Filter /FlateDecode >>\nstream\n(.*?)\nendstream', body, re.S)
+    return b''.join(zlib.decompress(s) for s in streams)
+
+def check_xref(body):
+    # Every xref entry must point at the start of its object
+    start = int(body.rsplit(b'startxref\n', 1)[1].split(b'\n')[0])
+    entries = body[start:].split(b'\n')
+    size = int(entries[1].split()[1])
+    for num, entry in enumerate(entries[3:2 + size], 1):
+        offset = int(entry.split()[0])
+        assert body[offset:].startswith(b'%d 0 obj' % num)
+
+def test_png_is_embedded_without_decoding():
+    header, data = png_image(render_png('http://example/scan-qr?plate=KAA001A'))
+    assert b'/BitsPerComponent 1' in header and b'/Predictor 15' in header
+    # The image data inflates to one filter byte plus packed pixels per row
+    width = int(re.search(rb'/Width (\d+)', header).group(1))
+    height = int(re.search(rb'/Height (\d+)', header).group(1))
+    assert len(zlib.decompress(data)) == height * (1 + (width + 7) // 8)
+
+def test_writer_produces_consistent_xref():
+    pdf = PDFStream(title='Test (1)')
+    page = Page()
+    page.text(40, 800, 'Hello (world) \\ ok')
+    page.image(render_png('x'), 40, 600, 100, 100)
+    body = pdf.begin() + pdf.add_page(page) + pdf.add_page(Page()) + pdf.end()
+    assert body.startswith(b'%PDF-1.4') and body.endswith(b'%%EOF\n')
+    assert page_count(body) == 2
+    check_xref(body)
+
+def test_movement_report_streams_pages(admin_client):
+    response = admin_client.get('/reports/movements.pdf?action=entry', buffered=False)
+    assert response.mimetype == 'application/pdf'
+    chunks = list(response.response)
+    body = b''.join(chunks)
+    # 65 entries at 50 rows a page, each page sent as its own chunk
+    assert page_count(body) == 2
+    assert len(chunks) == 4
+    check_xref(body)
+    text = page_text(body)
+    assert b'(KAA000A)' in text and b'(Entry)' in text and b'(Exit)' not in text
+    assert b'action: entry' in text
+
+def test_empty_report_still_has_a_page(admin_client):
+    body = admin_client.get('/reports/movements.pdf?plate=NOPE').data
+    assert page_count(body) == 1
+    assert b'No movements match' in page_text(body)
+
+def test_qr_sheet_uses_cached_images(admin_client):
+    client = admin_client
+    before = qr_cache.renders
+    body = client.get('/reports/qr-sheet.pdf?institution=Milimani').data
+    assert page_count(body) == 1
+    assert body.count(b'/Subtype /Image') == 7
+    assert qr_cache.renders - before <= 7
+    # A second sheet renders nothing new
+    rendered = qr_cache.renders
+    body = client.get('/reports/qr-sheet.pdf').data
+    assert page_count(body) == 2
+    assert body.count(b'/Subtype /Image') == 14
+    assert qr_cache.renders - rendered == 7
+    check_xref(body)
+
+def test_qr_sheet_selected_ids_and_login(admin_client):
+    with app.app_context():
+        ids = [v.id for v in Registration.query.order_by(Registration.id).limit(2)]
+    body = admin_client.get(f'/reports/qr-sheet.pdf?ids={ids[0]},{ids[1]}').data
+    assert body.count(b'/Subtype /Image') == 2
+    assert b'(KAA001A)' in page_text(body)
+    assert admin_client.get('/reports/qr-sheet.pdf?ids=a,b').status_code == 400
+    assert app.test_client().get('/reports/movements.pdf').status_code == 302
@@ -0,0 +1,43 @@
+import pytest
+from app import app, AuthorizedDevice, qr_cache
+from qr_cache import QRCache
+
+pytestmark = pytest.mark.usefixtures('gate')
+
+def test_disk_store_survives_memory_clear(tmp_path):
+    cache = QRCache(str(tmp_path), maxsize=4)
+    key, png = cache.get('http://gate/scan-qr?plate=KAA987M&token=t')
+    assert png.startswith(b'\x89PNG')
+    cache.memory.clear()
+    assert cache.get('http://gate/scan-qr?plate=KAA987M&token=t') == (key, png)
+    assert cache.renders == 1
+    assert (tmp_path / f'{key}.png').exists()
+
+def test_generate_qr_sets_etag_and_revalidates(tmp_path, admin_client):
+    qr_cache.directory = str(tmp_path)
+    qr_cache.clear()
+    client = admin_client
+    first = client.get('/generate-qr/KAA987M')
+    assert first.status_code == 200
+    assert first.mimetype == 'image/png'
+    assert 'max-age' in first.headers['Cache-Control']
+    etag = first.headers['ETag']
+    renders = qr_cache.renders
+    again = client.get('/generate-qr/KAA987M', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert qr_cache.renders == renders
+
+def test_rotating_token_keeps_signed_qr(tmp_path, admin_client):
+    # QR codes are signed and no longer embed a device token
+    qr_cache.directory = str(tmp_path)
+    client = admin_client
+    etag = client.get('/generate-qr/KAA987M').headers['ETag']
+    with app.app_context():
+        device_id = AuthorizedDevice.query.first().id
+    client.post(f'/admin/devices/{device_id}/rotate')
+    response = client.get('/generate-qr/KAA987M', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert client.get('/track/KAA987M/entry?token=gate-token').status_code == 403
+
+def test_unregistered_plate_has_no_qr(admin_client):
+    assert admin_client.get('/generate-qr/KZZ000Z').status_code == 404
@@ -0,0 +1,70 @@
+import os, time, datetime, sqlite3, pytest
+from app import app, db, Registration, Movement, refresh_reporting_snapshot, revoke_codes, revocations, scan_code
+
+@pytest.fixture(autouse=True)
+def reporting(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'REPORTING_MODE', 'snapshot')
+    monkeypatch.setitem(app.config, 'REPORTING_DB', str(tmp_path / 'reporting.db'))
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ001', plate='KAA001A', owner='Driver One', institution='0700000000'))
+        db.session.add(Movement(plate='KAA001A', action='entry', timestamp=datetime.datetime(2024, 3, 1, 6, 0)))
+        db.session.commit()
+        refresh_reporting_snapshot()
+        # Arrives after the copy was taken
+        db.session.add(Registration(pj_number='PJ002', plate='KBB002B', owner='Driver Two', institution='0700000001'))
+        db.session.add(Movement(plate='KBB002B', action='entry', timestamp=datetime.datetime(2024, 3, 1, 7, 0)))
+        db.session.commit()
+
+def test_snapshot_is_a_complete_copy():
+    conn = sqlite3.connect(app.config['REPORTING_DB'])
+    try:
+        assert conn.execute('SELECT plate FROM movement').fetchall() == [('KAA001A',)]
+        # Search indexes come along with their tables
+        assert conn.execute("SELECT count(*) FROM registration_fts WHERE registration_fts MATCH 'KAA'").fetchone() == (1,)
+    finally:
+        conn.close()
+
+def test_admin_views_read_the_snapshot_and_say_how_old_it_is(admin_client):
+    client = admin_client
+    logs = client.get('/view-logs')
+    assert b'KAA001A' in logs.data and b'KBB002B' not in logs.data
+    assert b'Showing data as of' in logs.data
+    assert 'X-Data-As-Of' in logs.headers
+    vehicles = client.get('/view-vehicles')
+    assert b'KAA001A' in vehicles.data and b'KBB002B' not in vehicles.data
+    export = client.get('/export_movements?format=ndjson')
+    assert b'KAA001A' in export.data and b'KBB002B' not in export.data
+
+def test_snapshot_views_never_fill_scan_caches(admin_client):
+    with app.app_context():
+        vehicle = Registration.query.filter_by(plate='KAA001A').one()
+        code = scan_code(vehicle)
+        # Revoked after the copy was taken
+        revoke_codes([vehicle.id])
+        db.session.commit()
+    revocations.clear()
+    assert b'Showing data as of' in admin_client.get('/view-vehicles').data
+    assert app.test_client().get(f'/track/KAA001A/entry?code={code}').status_code == 403
+
+def test_live_mode_reads_the_database(admin_client, monkeypatch):
+    monkeypatch.setitem(app.config, 'REPORTING_MODE', 'live')
+    logs = admin_client.get('/view-logs')
+    assert b'KBB002B' in logs.data
+    assert b'Showing data as of' not in logs.data
+    assert 'X-Data-As-Of' not in logs.headers
+
+def test_refresh_picks_up_new_rows(admin_client):
+    with app.app_context():
+        refresh_reporting_snapshot()
+    assert b'KBB002B' in admin_client.get('/view-logs').data
+
+def test_stale_snapshot_is_ignored(admin_client):
+    old = time.time() - app.config['REPORTING_MAX_AGE'] - 60
+    os.utime(app.config['REPORTING_DB'], (old, old))
+    assert b'KBB002B' in admin_client.get('/view-logs').data
+
+def test_page_after_a_change_reads_live(admin_client):
+    client = admin_client
+    with client.session_transaction() as sess:
+        sess['_flashes'] = [('success', 'Vehicle registered successfully.')]
+    assert b'KBB002B' in client.get('/view-vehicles').data
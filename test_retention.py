@@ -0,0 +1,49 @@
+import datetime, pytest
+from app import app, db, Movement, archive_movements
+import retention
+
+@pytest.fixture(autouse=True)
+def movements(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'ARCHIVE_DIR', str(tmp_path))
+    with app.app_context():
+        base = datetime.datetime(2024, 1, 30, 12, 0)
+        for i in range(10):
+            db.session.add(Movement(plate='KAA987M', action='entry' if i % 2 == 0 else 'exit',
+                                    timestamp=base + datetime.timedelta(days=i)))
+        db.session.add(Movement(plate='KBB123X', action='entry', timestamp=datetime.datetime.utcnow()))
+        db.session.commit()
+
+def test_archive_partitions_by_month_and_purges(tmp_path):
+    with app.app_context():
+        archived = archive_movements(datetime.datetime(2024, 3, 1), chunk_size=3)
+        assert archived == {'2024-01': 2, '2024-02': 8}
+        assert Movement.query.count() == 1
+    assert retention.list_months(str(tmp_path)) == ['2024-01', '2024-02']
+    assert [r['id'] for r in retention.read_records(str(tmp_path), '2024-01')] == [1, 2]
+
+def test_query_and_restore_month(admin_client):
+    with app.app_context():
+        archive_movements(datetime.datetime(2024, 3, 1), chunk_size=4)
+    client = admin_client
+    assert client.get('/archive').get_json()['months'] == ['2024-01', '2024-02']
+    lines = client.get('/archive/2024-02?plate=kaa987m').get_data(as_text=True).splitlines()
+    assert len(lines) == 8
+    response = client.post('/archive/2024-02/restore')
+    assert response.get_json()['restored'] == 8
+    # Restoring again is a no-op
+    assert client.post('/archive/2024-02/restore').get_json()['restored'] == 0
+    with app.app_context():
+        assert Movement.query.count() == 9
+    assert client.get('/archive/2023-13').status_code == 404
+
+def test_clear_logs_archives_instead_of_deleting(tmp_path, admin, admin_client):
+    response = admin_client.post('/clear_logs', json={'password': 'admin123'})
+    assert response.get_json()['success']
+    with app.app_context():
+        assert Movement.query.count() == 0
+        db.session.add(Movement(plate='KCC555Z', action='entry'))
+        db.session.commit()
+        # Ids are not reused after the table is emptied
+        assert Movement.query.one().id == 12
+    total = sum(1 for m in retention.list_months(str(tmp_path)) for _ in retention.read_records(str(tmp_path), m))
+    assert total == 11
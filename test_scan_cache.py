@@ -0,0 +1,41 @@
+import time, pytest
+from app import app, Registration, Movement, device_cache, plate_cache
+from ttl_cache import TTLCache
+
+pytestmark = pytest.mark.usefixtures('gate')
+
+def test_ttl_cache_expires_and_bounds():
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+    assert cache.get('a') is None
+    assert cache.get('c') == 3
+    time.sleep(0.06)
+    assert cache.get('c') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
+
+def test_repeated_scans_hit_cache():
+    client = app.test_client()
+    before = device_cache.stats(), plate_cache.stats()
+    for action in ('entry', 'exit', 'entry'):
+        response = client.get(f'/track/KAA987M/{action}?token=gate-token')
+        assert response.status_code == 200
+    assert device_cache.stats()['misses'] - before[0]['misses'] == 1
+    assert device_cache.stats()['hits'] - before[0]['hits'] == 2
+    assert plate_cache.stats()['hits'] - before[1]['hits'] == 2
+    with app.app_context():
+        assert Movement.query.count() == 3
+
+def test_delete_invalidates_plate(admin, admin_client):
+    with app.app_context():
+        vehicle_id = Registration.query.filter_by(plate='KAA987M').first().id
+    client = admin_client
+    assert client.get('/track/KAA987M/entry?token=gate-token').status_code == 200
+    client.post(f'/delete/{vehicle_id}', data={'admin_password': 'admin123'})
+    assert client.get('/track/KAA987M/entry?token=gate-token').status_code == 404
+
+def test_unknown_token_rejected():
+    response = app.test_client().get('/track/KAA987M/entry?token=nope')
+    assert response.status_code == 403
@@ -0,0 +1,56 @@
+import datetime, pytest
+from sqlalchemy import event
+from app import app, db, Movement, Presence
+from metrics import render_all
+
+pytestmark = pytest.mark.usefixtures('gate')
+
+@pytest.fixture(autouse=True)
+def debounce(monkeypatch):
+    monkeypatch.setitem(app.config, 'SCAN_DEBOUNCE_SECONDS', 10)
+
+def scan(action, plate='KAA987M'):
+    return app.test_client().get(f'/track/{plate}/{action}?token=gate-token')
+
+def recorded_actions():
+    with app.app_context():
+        return [m.action for m in Movement.query.order_by(Movement.id)]
+
+def test_double_tap_is_suppressed():
+    assert scan('entry').get_json()['status'] == 'success'
+    response = scan('entry')
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'duplicate'
+    assert response.get_json()['action'] == 'entry'
+    # Correcting the action straight away is still recorded
+    assert scan('exit').get_json()['status'] == 'success'
+    assert recorded_actions() == ['entry', 'exit']
+
+def test_auto_alternates_outside_the_window(monkeypatch):
+    monkeypatch.setitem(app.config, 'SCAN_DEBOUNCE_SECONDS', 0)
+    actions = [scan('auto').get_json()['action'] for _ in range(3)]
+    assert actions == ['entry', 'exit', 'entry']
+    assert recorded_actions() == actions
+
+def test_auto_within_window_returns_last_outcome():
+    scan('auto')
+    response = scan('auto').get_json()
+    assert (response['status'], response['action']) == ('duplicate', 'entry')
+    assert recorded_actions() == ['entry']
+    assert 'scans_debounced_total ' in render_all()
+
+def test_cold_cache_infers_from_presence_without_reading_movement():
+    with app.app_context():
+        db.session.add(Presence(plate='KAA987M', last_action='entry',
+                                last_timestamp=datetime.datetime.utcnow() - datetime.timedelta(hours=2)))
+        db.session.commit()
+        engine = db.engine
+    statements = []
+    def capture(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        assert scan('auto').get_json()['action'] == 'exit'
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+    assert not [s for s in statements if 'FROM movement' in s]
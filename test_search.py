@@ -0,0 +1,42 @@
+import pytest
+from app import app, db, Registration
+
+@pytest.fixture(autouse=True)
+def vehicles(gate_device):
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ001', plate='KAA987M', owner='Jane Wanjiru', institution='Milimani'))
+        db.session.add(Registration(pj_number='PJ002', plate='KBB123X', owner='John Otieno', institution='Kibera'))
+        db.session.add(Registration(pj_number='PJ003', plate='KAA111A', owner='Mary Achieng', institution='Milimani'))
+        db.session.commit()
+
+@pytest.fixture
+def search(admin_client):
+    return lambda q: admin_client.get('/search', query_string={'q': q}).get_json()
+
+def test_partial_plate_with_space_matches(search):
+    assert [v['plate'] for v in search('kaa 98')['vehicles']] == ['KAA987M']
+    assert {v['plate'] for v in search('KAA')['vehicles']} == {'KAA987M', 'KAA111A'}
+
+def test_owner_and_institution_fragments_match(search):
+    assert [v['pj_number'] for v in search('otien')['vehicles']] == ['PJ002']
+    assert {v['plate'] for v in search('limani')['vehicles']} == {'KAA987M', 'KAA111A'}
+
+def test_index_follows_updates_and_deletes(search):
+    with app.app_context():
+        vehicle = Registration.query.filter_by(plate='KBB123X').first()
+        vehicle.plate = 'KCC555C'
+        db.session.commit()
+        assert search('KBB1')['vehicles'] == []
+        assert [v['plate'] for v in search('CC55')['vehicles']] == ['KCC555C']
+        db.session.delete(vehicle)
+        db.session.commit()
+    assert search('CC55')['vehicles'] == []
+
+def test_plates_seen_at_gates_are_searchable(search):
+    app.test_client().get('/track/KAA987M/entry?token=gate-token&gate=north')
+    plates = search('987')['plates']
+    assert [(p['plate'], p['last_action'], p['gate']) for p in plates] == [('KAA987M', 'entry', 'north')]
+
+def test_short_query_falls_back_to_prefix_and_requires_admin(search):
+    assert {v['plate'] for v in search('kb')['vehicles']} == {'KBB123X'}
+    assert app.test_client().get('/search?q=KAA').status_code == 401
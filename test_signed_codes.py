@@ -0,0 +1,119 @@
+import re, pytest
+import app as app_module
+from app import app, db, Registration, scan_code
+from signing import CodeSigner, parse_keys
+from sqlalchemy import event
+
+pytestmark = pytest.mark.usefixtures('gate', 'no_debounce')
+
+def current_code():
+    with app.app_context():
+        return scan_code(Registration.query.one())
+
+def test_sign_and_verify_round_trip():
+    signer = CodeSigner(parse_keys('k2:new-secret,k1:old-secret'))
+    code = signer.sign('KAA987M', 42, 1718000000)
+    assert signer.verify(code) == ('k2', 42, 1718000000, 'KAA987M')
+    with pytest.raises(ValueError):
+        signer.verify(code.replace('KAA987M', 'KAA987N'))
+    with pytest.raises(ValueError):
+        parse_keys('no-secret')
+
+def test_rotated_key_still_verifies_until_retired():
+    old = CodeSigner(parse_keys('k1:old-secret'))
+    code = old.sign('KAA987M', 1, 1718000000)
+    assert CodeSigner(parse_keys('k2:new-secret,k1:old-secret')).verify(code).key_id == 'k1'
+    with pytest.raises(ValueError):
+        CodeSigner(parse_keys('k2:new-secret')).verify(code)
+
+def test_signed_scan_skips_device_query_and_caches_registration():
+    code = current_code()
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        for action in ('entry', 'exit'):
+            response = app.test_client().get(f'/track/KAA987M/{action}?code={code}')
+            assert response.get_json()['status'] == 'success'
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    assert not [s for s in statements if 'authorized_device' in s]
+    assert len([s for s in statements if 'FROM registration' in s]) == 1
+
+def test_qr_url_carries_signed_code(admin_client):
+    response = admin_client.get('/generate-qr/KAA987M')
+    assert response.status_code == 200
+    page = app.test_client().get(f'/scan-qr?code={current_code()}')
+    assert page.status_code == 200
+    assert b'KAA987M' in page.data
+
+def test_tampered_and_mismatched_codes_are_refused():
+    code = current_code()
+    assert app.test_client().get(f'/track/KAA987M/entry?code={code[:-2]}xx').status_code == 403
+    assert app.test_client().get(f'/track/KBB111B/entry?code={code}').status_code == 403
+    assert app.test_client().get(f'/scan-qr?code={code[:-2]}xx').status_code == 403
+
+def test_non_ascii_codes_are_refused():
+    code = current_code()
+    for bad in (code[:-2] + '%C3%A9', 'test.1.1.KAA987M.%C3%A9', code.replace('.', '%C3%A9.', 1)):
+        assert app.test_client().get(f'/track/KAA987M/entry?code={bad}').status_code == 403
+        assert app.test_client().get(f'/scan-qr?code={bad}').status_code == 403
+
+def test_revocation_invalidates_printed_codes_only(admin_client):
+    old = current_code()
+    with app.app_context():
+        vehicle_id = Registration.query.one().id
+    admin_client.post(f'/vehicles/{vehicle_id}/revoke-qr')
+    assert app.test_client().get(f'/track/KAA987M/entry?code={old}').status_code == 403
+    new = current_code()
+    assert new != old
+    assert app.test_client().get(f'/track/KAA987M/entry?code={new}').status_code == 200
+
+def qr_image_url(client):
+    return re.search(r'/generate-qr/KAA987M\?v=[\w-]+', client.get('/view-vehicles').get_data(as_text=True)).group()
+
+def test_vehicle_list_points_at_a_new_image_for_a_new_code(monkeypatch, admin_client):
+    monkeypatch.setattr(app_module, 'is_elevated', lambda: True)
+    urls = [qr_image_url(admin_client)]
+    with app.app_context():
+        vehicle_id = Registration.query.one().id
+    admin_client.post(f'/vehicles/{vehicle_id}/revoke-qr')
+    urls.append(qr_image_url(admin_client))
+    # Registering the plate again after deleting it
+    admin_client.post(f'/delete/{vehicle_id}')
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ001', plate='KAA987M', owner='Test Driver', institution='0700000000'))
+        db.session.commit()
+    urls.append(qr_image_url(admin_client))
+    assert len(set(urls)) == 3
+
+def test_code_for_missing_registration_is_refused():
+    code = current_code()
+    # e.g. a database rebuilt without its revocation list
+    with app.app_context():
+        db.session.execute(db.delete(Registration))
+        db.session.commit()
+    assert app.test_client().get(f'/track/KAA987M/entry?code={code}').status_code == 403
+
+def test_default_secret_key_signs_nothing(monkeypatch):
+    monkeypatch.setitem(app.config, 'QR_SIGNING_KEYS', '')
+    monkeypatch.setattr(app, 'secret_key', app_module.DEFAULT_SECRET_KEY)
+    assert app_module.make_code_signer() is None
+    monkeypatch.setattr(app, 'secret_key', 'a-real-secret')
+    assert app_module.make_code_signer().current == 'k0'
+
+def test_signed_codes_refused_without_a_key(monkeypatch):
+    code = current_code()
+    monkeypatch.setattr(app_module, 'code_signer', None)
+    assert app.test_client().get(f'/track/KAA987M/entry?code={code}').status_code == 403
+    assert app.test_client().get(f'/scan-qr?code={code}').status_code == 403
+
+def test_deleting_vehicle_revokes_its_codes(monkeypatch, admin_client):
+    monkeypatch.setattr(app_module, 'is_elevated', lambda: True)
+    code = current_code()
+    with app.app_context():
+        vehicle_id = Registration.query.one().id
+    admin_client.post(f'/delete/{vehicle_id}')
+    assert app.test_client().get(f'/track/KAA987M/entry?code={code}').status_code == 403
@@ -0,0 +1,71 @@
+import os, sqlite3, subprocess, sys, tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def run_python(code, flask_cli=False, database=None, unset=()):
+    # Fresh interpreter, so sys.modules reflects only what app imports
+    database = database or os.path.join(tempfile.mkdtemp(), 'startup.db')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}")
+    for name in ('FLASK_RUN_FROM_CLI',) + unset:
+        env.pop(name, None)
+    if flask_cli:
+        env['FLASK_RUN_FROM_CLI'] = 'true'
+    result = subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+def test_import_skips_heavy_modules():
+    heavy = ('qrcode', 'PIL', 'smtplib', 'alembic', 'flask_migrate')
+    assert run_python(f"import sys, app; print([m for m in {heavy!r} if m in sys.modules])") == '[]'
+
+def test_flask_cli_still_gets_migrations():
+    assert run_python("import app; print('migrate' in app.app.extensions)", flask_cli=True) == 'True'
+
+def test_create_app_creates_tables():
+    assert run_python("import app, sqlalchemy\n"
+                      "with app.create_app(workers=False).app_context():\n"
+                      "    print(sqlalchemy.inspect(app.db.engine).has_table('movement'))") == 'True'
+
+def test_create_app_refuses_default_signing_key():
+    from app import NO_SIGNING_KEY
+    assert run_python("import app\n"
+                      "try:\n"
+                      "    app.create_app(workers=False)\n"
+                      "except RuntimeError as e:\n"
+                      "    print(e)", unset=('SECRET_KEY', 'QR_SIGNING_KEYS')) == NO_SIGNING_KEY
+
+def test_schema_revision_is_migrations_head():
+    from alembic.script import ScriptDirectory
+    from app import SCHEMA_REVISION, MIGRATIONS_DIR
+    assert ScriptDirectory(MIGRATIONS_DIR).get_current_head() == SCHEMA_REVISION
+
+def test_create_app_upgrades_database_made_before_migrations():
+    # The tables db.create_all() made before any migration existed
+    database = os.path.join(tempfile.mkdtemp(), 'legacy.db')
+    conn = sqlite3.connect(database)
+    conn.executescript("""
+        CREATE TABLE admin (id INTEGER PRIMARY KEY, username VARCHAR(50) NOT NULL UNIQUE, email VARCHAR(120) UNIQUE,
+                            password_hash VARCHAR(128) NOT NULL);
+        CREATE TABLE authorized_device (id INTEGER PRIMARY KEY, mac_address VARCHAR(17) NOT NULL UNIQUE,
+                                        token VARCHAR(64) NOT NULL UNIQUE);
+        CREATE TABLE movement (id INTEGER PRIMARY KEY, plate VARCHAR(20) NOT NULL, action VARCHAR(10) NOT NULL,
+                               timestamp DATETIME);
+        CREATE TABLE registration (id INTEGER PRIMARY KEY, pj_number VARCHAR(20) NOT NULL UNIQUE,
+                                   plate VARCHAR(20) NOT NULL, owner VARCHAR(100) NOT NULL,
+                                   institution VARCHAR(100) NOT NULL, qr_path VARCHAR(100), timestamp DATETIME);
+        INSERT INTO authorized_device (mac_address, token) VALUES ('4C:66:A6:84:59:79', 'gate-token');
+        INSERT INTO registration (pj_number, plate, owner, institution) VALUES ('PJ001', 'KAA987M', 'Driver', 'ODPP');
+        INSERT INTO movement (plate, action, timestamp) VALUES ('KAA987M', 'entry', '2024-01-01 05:00:00.000000');
+    """)
+    conn.commit()
+    conn.close()
+    code = ("import app\n"
+            "with app.create_app(workers=False).test_client() as client:\n"
+            "    print(client.get('/track/KAA987M/exit?token=gate-token&gate=Gate 3').status_code)\n"
+            "with app.app.app_context():\n"
+            "    print(app.schema_revision() == app.SCHEMA_REVISION, app.Movement.query.count(),\n"
+            "          app.Visit.query.filter_by(status='closed').count())")
+    assert run_python(code, database=database).splitlines() == ['200', 'True 2 1']
+    # Starting again finds the database current and leaves it alone
+    assert run_python("import app\napp.create_app(workers=False)\nimport sys\nprint('alembic' in sys.modules)",
+                      database=database) == 'False'
@@ -0,0 +1,60 @@
+import pytest
+from app import app, db, Registration, Movement
+
+@pytest.fixture(autouse=True)
+def vehicles(gate):
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ002', plate='KBB123X', owner='Other Driver', institution='0711111111'))
+        db.session.commit()
+
+def post_batch(records, token='gate-token'):
+    return app.test_client().post(f'/track/batch?token={token}', json=records)
+
+def test_batch_reports_per_record_status():
+    response = post_batch([
+        {'plate': 'kaa987m', 'action': 'entry', 'client_timestamp': '2024-01-01T08:00:00Z', 'idempotency_key': 'g3-1'},
+        {'plate': 'KBB123X', 'action': 'entry', 'client_timestamp': '2024-01-01T11:05:00+03:00', 'idempotency_key': 'g3-2'},
+        {'plate': 'UNREG1', 'action': 'entry', 'idempotency_key': 'g3-3'},
+        {'plate': 'KAA987M', 'action': 'park', 'idempotency_key': 'g3-4'},
+        {'plate': 'KAA987M', 'action': 'exit', 'client_timestamp': 'yesterday', 'idempotency_key': 'g3-5'},
+    ])
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [r['status'] for r in data['results']] == ['accepted', 'accepted', 'not_registered', 'invalid', 'invalid']
+    assert data['accepted'] == 2
+    with app.app_context():
+        rows = Movement.query.order_by(Movement.id).all()
+        assert [r.plate for r in rows] == ['KAA987M', 'KBB123X']
+        # Client timestamps are stored as naive UTC
+        assert rows[1].timestamp.hour == 8 and rows[1].timestamp.minute == 5
+
+def test_replayed_batch_is_not_recorded_twice():
+    records = [{'plate': 'KAA987M', 'action': 'entry', 'idempotency_key': 'g3-10'},
+               {'plate': 'KAA987M', 'action': 'exit', 'idempotency_key': 'g3-11'}]
+    post_batch(records)
+    response = post_batch(records + [{'plate': 'KAA987M', 'action': 'entry', 'idempotency_key': 'g3-11'}])
+    assert [r['status'] for r in response.get_json()['results']] == ['duplicate', 'duplicate', 'duplicate']
+    with app.app_context():
+        assert Movement.query.count() == 2
+
+def test_malformed_fields_are_rejected_per_record():
+    response = post_batch([
+        {'plate': None, 'action': 'entry'},
+        {'plate': 'KAA987M', 'action': 'entry', 'idempotency_key': ['g3-20']},
+        {'plate': 'KAA987M', 'action': 'entry', 'idempotency_key': 'k' * 65},
+        {'plate': 'KAA987M', 'action': 'entry', 'gate': {'name': 'north'}},
+        {'plate': 'KAA987M', 'action': 'entry', 'client_timestamp': 1700000000},
+        {'plate': 'KAA987M', 'action': 'entry', 'idempotency_key': 'g3-21', 'gate': 'north'},
+    ])
+    assert response.status_code == 200
+    assert [r['status'] for r in response.get_json()['results']] == ['invalid'] * 5 + ['accepted']
+    with app.app_context():
+        assert [(m.plate, m.gate) for m in Movement.query] == [('KAA987M', 'north')]
+
+def test_batch_requires_valid_token():
+    assert post_batch([], token='nope').status_code == 403
+
+def test_batch_size_limit(monkeypatch):
+    monkeypatch.setitem(app.config, 'TRACK_BATCH_MAX', 2)
+    response = post_batch([{'plate': 'KAA987M', 'action': 'entry'}] * 3)
+    assert response.status_code == 413
@@ -0,0 +1,51 @@
+import datetime
+from app import app, db, Registration, Movement, TrafficRollup, refresh_rollups
+
+def setup_function():
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ001', plate='KAA987M', owner='Driver', institution='High Court'))
+        db.session.add(Registration(pj_number='PJ002', plate='KBB123X', owner='Driver', institution='ODPP'))
+        db.session.commit()
+
+def add_movements(*rows):
+    with app.app_context():
+        for plate, action, ts in rows:
+            db.session.add(Movement(plate=plate, action=action, timestamp=ts))
+        db.session.commit()
+
+def test_rollups_are_incremental():
+    t = datetime.datetime(2024, 1, 1, 5, 10)  # 08:10 in Nairobi
+    add_movements(('KAA987M', 'entry', t), ('KBB123X', 'entry', t), ('KAA987M', 'exit', t + datetime.timedelta(hours=2)))
+    with app.app_context():
+        assert refresh_rollups() == 3
+        assert refresh_rollups() == 0
+    add_movements(('KAA987M', 'entry', t + datetime.timedelta(minutes=30)), ('UNREG1', 'entry', t))
+    with app.app_context():
+        assert refresh_rollups() == 2
+        counts = {(r.bucket.hour, r.institution, r.action): r.count for r in TrafficRollup.query}
+    assert counts == {(8, 'High Court', 'entry'): 2, (8, 'ODPP', 'entry'): 1,
+                      (10, 'High Court', 'exit'): 1, (8, 'Unknown', 'entry'): 1}
+
+def test_refresh_counts_rows_not_ids():
+    with app.app_context():
+        db.session.add_all([Movement(id=1, plate='KAA987M', action='entry', timestamp=datetime.datetime(2024, 1, 1, 5, 0)),
+                            Movement(id=50, plate='KAA987M', action='exit', timestamp=datetime.datetime(2024, 1, 1, 6, 0))])
+        db.session.commit()
+        assert refresh_rollups() == 2
+
+def test_daily_series_by_institution(admin_client):
+    t = datetime.datetime(2024, 1, 1, 22, 0)  # already 2 January in Nairobi
+    add_movements(('KAA987M', 'entry', t), ('KAA987M', 'exit', t + datetime.timedelta(hours=3)),
+                  ('KBB123X', 'entry', t))
+    data = admin_client.get('/analytics/traffic?granularity=day&institution=High Court').get_json()
+    assert data['series'] == [{'bucket': '2024-01-02', 'institution': 'High Court', 'entry': 1, 'exit': 1}]
+
+def test_clear_logs_keeps_rollups(admin, admin_client):
+    add_movements(('KAA987M', 'entry', datetime.datetime(2024, 1, 1, 5, 0)))
+    client = admin_client
+    client.get('/analytics/traffic')
+    client.post('/clear_logs', json={'password': 'admin123'})
+    # Movement ids keep counting up after a clear, so the watermark stays valid
+    add_movements(('KBB123X', 'entry', datetime.datetime(2024, 1, 1, 5, 0)))
+    series = client.get('/analytics/traffic').get_json()['series']
+    assert {(p['institution'], p['entry']) for p in series} == {('High Court', 1), ('ODPP', 1)}
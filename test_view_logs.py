@@ -0,0 +1,55 @@
+import datetime
+from app import app, db, Movement, movement_filters, movement_page
+
+def setup_function():
+    with app.app_context():
+        base = datetime.datetime(2024, 1, 1, 8, 0, 0)
+        for i in range(25):
+            db.session.add(Movement(plate='KAA987M' if i % 2 else 'KBB123X',
+                                    action='entry' if i % 4 < 2 else 'exit',
+                                    timestamp=base + datetime.timedelta(hours=i)))
+        # Two rows sharing a timestamp must both be reachable across pages
+        db.session.add(Movement(plate='KCC555Z', action='entry', timestamp=base))
+        db.session.commit()
+
+def test_pages_cover_all_rows_once():
+    with app.app_context():
+        seen = []
+        cursor = None
+        while True:
+            logs, cursor = movement_page([], cursor, per_page=7)
+            seen.extend(log['id'] for log in logs)
+            if not cursor:
+                break
+        assert len(seen) == 26
+        assert len(set(seen)) == 26
+
+def test_pages_are_newest_first():
+    with app.app_context():
+        logs, cursor = movement_page([], per_page=5)
+        stamps = [log['timestamp'] for log in logs]
+        assert stamps == sorted(stamps, reverse=True)
+        assert cursor is not None
+
+def test_plate_and_action_filters():
+    with app.app_context():
+        filters = movement_filters({'plate': 'kaa987m', 'action': 'exit'})
+        logs, cursor = movement_page(filters, per_page=50)
+        assert logs
+        assert cursor is None
+        assert all(log['plate'] == 'KAA987M' and log['action'] == 'exit' for log in logs)
+
+def test_date_range_is_nairobi_local():
+    with app.app_context():
+        # 2024-01-01 in Nairobi (UTC+3) ends at 2024-01-01 21:00 UTC
+        filters = movement_filters({'date_from': '2024-01-01', 'date_to': '2024-01-01'})
+        logs, _ = movement_page(filters, per_page=100)
+        assert len(logs) == 14
+        assert all(log['timestamp'].date() == datetime.date(2024, 1, 1) for log in logs)
+
+def test_invalid_cursor_rejected():
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['admin'] = 'admin'
+    response = client.get('/view-logs?cursor=garbage')
+    assert response.status_code == 400
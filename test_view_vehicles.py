@@ -0,0 +1,32 @@
+import datetime, pytest
+from app import app, db, Registration
+
+@pytest.fixture(autouse=True)
+def vehicle(admin):
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ001', plate='KAA987M', owner='Jane Driver', institution='0700',
+                                    timestamp=datetime.datetime(2024, 1, 1, 5, 0)))
+        db.session.commit()
+
+def test_list_shows_nairobi_time(admin_client):
+    response = admin_client.get('/view-vehicles')
+    assert response.status_code == 200
+    assert b'Jane Driver' in response.data
+    assert b'2024-01-01 08:00:00' in response.data
+
+def test_unchanged_list_revalidates_with_304(admin_client):
+    client = admin_client
+    etag = client.get('/view-vehicles').headers['ETag']
+    assert client.get('/view-vehicles', headers={'If-None-Match': etag}).status_code == 304
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ002', plate='KBB123X', owner='John', institution='0711'))
+        db.session.commit()
+    response = client.get('/view-vehicles', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'KBB123X' in response.data
+
+def test_elevation_changes_etag(admin_client):
+    client = admin_client
+    etag = client.get('/view-vehicles').headers['ETag']
+    client.post('/vehicles/bulk-delete', json={'ids': [999], 'password': 'admin123'})
+    assert client.get('/view-vehicles', headers={'If-None-Match': etag}).status_code == 200
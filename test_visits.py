@@ -0,0 +1,77 @@
+import random, datetime
+from app import app, db, Registration, Movement, Visit, record_movements, rebuild_visits, fill_visit_institutions
+
+T = datetime.datetime(2024, 1, 1, 5, 0)  # 08:00 in Nairobi
+
+def setup_function():
+    with app.app_context():
+        db.session.add(Registration(pj_number='PJ001', plate='KAA987M', owner='Driver', institution='High Court'))
+        db.session.add(Registration(pj_number='PJ002', plate='KBB123X', owner='Driver', institution='ODPP'))
+        db.session.commit()
+
+def scan(*rows):
+    with app.app_context():
+        record_movements([{'plate': plate, 'action': action, 'timestamp': T + datetime.timedelta(hours=hours)}
+                          for plate, action, hours in rows])
+
+def visits(plate):
+    with app.app_context():
+        rows = Visit.query.filter_by(plate=plate).order_by(db.func.coalesce(Visit.entered_at, Visit.exited_at)).all()
+        return [(v.status, v.duration_seconds) for v in rows]
+
+def test_scans_pair_into_visits():
+    scan(('KAA987M', 'entry', 0))
+    assert visits('KAA987M') == [('open', None)]
+    scan(('KAA987M', 'exit', 2))
+    scan(('KAA987M', 'entry', 3), ('KBB123X', 'exit', 3), ('KAA987M', 'entry', 4))
+    assert visits('KAA987M') == [('closed', 7200), ('missing_exit', None), ('open', None)]
+    assert visits('KBB123X') == [('orphan_exit', None)]
+    with app.app_context():
+        assert Visit.query.filter(Visit.institution.isnot(None)).count() == 0
+        fill_visit_institutions()
+        visit = Visit.query.filter_by(plate='KAA987M', status='closed').one()
+        assert (visit.institution, visit.day) == ('High Court', datetime.date(2024, 1, 1))
+
+def test_late_upload_repairs_pairing():
+    scan(('KAA987M', 'entry', 0), ('KAA987M', 'entry', 4))
+    assert visits('KAA987M') == [('missing_exit', None), ('open', None)]
+    # The exit scanned offline at 10:00 arrives after the 12:00 entry
+    scan(('KAA987M', 'exit', 2))
+    assert visits('KAA987M') == [('closed', 7200), ('open', None)]
+    scan(('KAA987M', 'exit', 5))
+    assert visits('KAA987M') == [('closed', 7200), ('closed', 3600)]
+
+def test_rebuild_matches_incremental_pairing():
+    random.seed(7)
+    for _ in range(30):
+        scan(*[(random.choice(['KAA987M', 'KBB123X', 'UNREG1']), random.choice(['entry', 'entry', 'exit']),
+                random.uniform(0, 48)) for _ in range(random.randint(1, 4))])
+    columns = ('plate', 'status', 'entry_id', 'exit_id', 'duration_seconds', 'institution', 'day')
+    with app.app_context():
+        def snapshot():
+            return sorted(tuple(getattr(v, c) for c in columns) for v in Visit.query)
+        fill_visit_institutions()
+        incremental = snapshot()
+        assert rebuild_visits(chunk_size=7) == len(incremental)
+        assert snapshot() == incremental
+        paired = {v.entry_id for v in Visit.query} | {v.exit_id for v in Visit.query}
+        assert {m.id for m in Movement.query} <= paired
+
+def test_dwell_percentiles_per_group(admin_client):
+    for i, hours in enumerate((1, 2, 3, 4)):
+        scan(('KAA987M', 'entry', 24 * i), ('KAA987M', 'exit', 24 * i + hours))
+    scan(('KBB123X', 'entry', 0), ('KBB123X', 'exit', 0.5), ('KBB123X', 'entry', 1))
+    client = admin_client
+    data = client.get('/analytics/dwell?group=institution&p=50').get_json()
+    assert data['groups'] == [
+        {'institution': 'High Court', 'visits': 4, 'avg_minutes': 150.0, 'p50_minutes': 120.0,
+         'longest_minutes': 240.0, 'open': 0, 'missing_exit': 0, 'orphan_exit': 0},
+        {'institution': 'ODPP', 'visits': 1, 'avg_minutes': 30.0, 'p50_minutes': 30.0,
+         'longest_minutes': 30.0, 'open': 1, 'missing_exit': 0, 'orphan_exit': 0}]
+    days = client.get('/analytics/dwell?group=day&plate=kaa987m&date_from=2024-01-02').get_json()['groups']
+    assert [(d['day'], d['p95_minutes']) for d in days] == [('2024-01-02', 120.0), ('2024-01-03', 180.0),
+                                                            ('2024-01-04', 240.0)]
+    # A negative limit would mean no limit to SQLite
+    assert len(client.get('/analytics/dwell?group=day&limit=-1').get_json()['groups']) == 1
+    assert client.get('/analytics/dwell?group=gate').status_code == 400
+    assert app.test_client().get('/analytics/dwell').status_code == 302